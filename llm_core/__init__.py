@@ -0,0 +1,7 @@
+"""
+Shared building blocks for the Streamlit LLM applications.
+
+The apps live in their own directories and are started with
+`streamlit run <app>/main.py`, so each of them adds the repository root to
+sys.path before importing this package.
+"""
@@ -0,0 +1,128 @@
+"""
+Measure the cold start of the Streamlit apps.
+
+Each app is run in a fresh interpreter with Streamlit's AppTest harness, as on
+a freshly started pod, and the benchmark reports:
+
+- streamlit: time to import Streamlit itself, the floor of any cold start
+- first paint: time from the start of the script to the first element sent to the browser
+- first run: time to run the whole script once, without any user input
+- top imports: the slowest top-level imports made while running the script
+
+    python -m llm_core.bench_startup                       # every app
+    python -m llm_core.bench_startup streamlit-ask-csv --runs 5
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Code run in the child interpreter, prints the measurements as JSON
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+
+first_paint = []
+try:
+    from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+except ImportError:
+    from streamlit.runtime.scriptrunner.script_run_context import ScriptRunContext
+enqueue = ScriptRunContext.enqueue
+
+def timed_enqueue(self, msg):
+    if not first_paint and msg.HasField("delta"):
+        first_paint.append(time.perf_counter())
+    return enqueue(self, msg)
+
+ScriptRunContext.enqueue = timed_enqueue
+
+script_start = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+app.run()
+done = time.perf_counter()
+
+print(json.dumps({
+    "streamlit": imported - start,
+    "first_paint": (first_paint[0] if first_paint else done) - script_start,
+    "first_run": done - script_start,
+    "error": str(app.exception[0].message) if app.exception else None,
+}))
+"""
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def top_imports(stderr, limit):
+    """Slowest top-level imports, in seconds, from the -X importtime output."""
+    cumulative = {}
+    # Interpreter startup, Streamlit and the test harness are measured separately,
+    # only the imports made once the harness is loaded are attributed to the app
+    harness_loaded = False
+    for match in IMPORT_TIME_LINE.finditer(stderr):
+        _, total, indent, module = match.groups()
+        if indent:
+            continue
+        if module == "streamlit.testing.v1":
+            harness_loaded = True
+        elif harness_loaded and module.split(".")[0] != "streamlit":
+            cumulative[module] = cumulative.get(module, 0) + int(total) / 1e6
+    return sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def measure(app_dir, runs, top):
+    script = str(ROOT / app_dir / "main.py")
+    samples = []
+    imports = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD, script],
+            cwd=ROOT / app_dir, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{app_dir} failed:\n{result.stderr[-2000:]}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        imports = top_imports(result.stderr, top)
+
+    report = {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in ("streamlit", "first_paint", "first_run")
+    }
+    report["error"] = samples[-1]["error"]
+    report["top_imports"] = imports
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first paint of the apps.")
+    parser.add_argument("apps", nargs="*", help="App directories, every app by default.")
+    parser.add_argument("--runs", type=int, default=3, help="Cold runs per app, the median is reported.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports listed per app.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args()
+
+    apps = args.apps or sorted(path.parent.name for path in ROOT.glob("streamlit-*/main.py"))
+    results = {app: measure(app, args.runs, args.top) for app in apps}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'app':<45} {'streamlit':>10} {'1st paint':>10} {'1st run':>10}")
+    for app, report in results.items():
+        print(f"{app:<45} {report['streamlit']:>9.2f}s {report['first_paint']:>9.2f}s {report['first_run']:>9.2f}s")
+        if report["error"]:
+            print(f"    error: {report['error']}")
+        for module, seconds in report["top_imports"]:
+            print(f"    {module:<41} {seconds:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Compare vector store storage options on size, load time, latency and recall.
+
+Every configuration is built from the same vectors and compared with the
+layout of LangChain's FAISS store (flat float32 index plus pickled
+documents), which is also the exact search used as ground truth:
+
+    python -m llm_core.bench_vector_store --csv streamlit-ask-csv/napoleon-faqs.csv --column prompt
+    python -m llm_core.bench_vector_store --vectors embeddings.npy --texts texts.txt
+    python -m llm_core.bench_vector_store --synthetic 200000 --dim 768 --factory SQ8 --factory PCA256,PQ32
+
+Recall@k is the share of the exact k nearest neighbours found by the
+compressed index, for queries taken from the data with some noise added.
+"""
+import argparse
+import csv
+import pickle
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from llm_core.folders import folder_size
+from llm_core.quantized_store import QuantizedFAISS
+
+DEFAULT_FACTORIES = ["SQ8", "PCA256,SQ8", "PQ64", "PCA256,PQ32"]
+
+
+def load_vectors(args):
+    """Return the texts and their float32 vectors, as selected on the command line."""
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        # Clustered data, closer to real embeddings than uniform noise
+        centers = rng.normal(size=(max(args.synthetic // 100, 1), args.dim))
+        vectors = centers[rng.integers(0, len(centers), args.synthetic)]
+        vectors += 0.3 * rng.normal(size=vectors.shape)
+        texts = [f"Synthetic document {i}. " + "lorem ipsum dolor sit amet " * 8 for i in range(args.synthetic)]
+        return texts, vectors.astype(np.float32)
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        if args.texts:
+            texts = Path(args.texts).read_text(encoding="utf-8").splitlines()[:len(vectors)]
+        else:
+            texts = [f"Document {i}" for i in range(len(vectors))]
+        return texts, vectors
+
+    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+    with open(args.csv, newline="", encoding="utf-8") as file:
+        texts = [row[args.column] for row in csv.DictReader(file)]
+    vectors = np.asarray(HuggingFaceEmbeddings().embed_documents(texts), dtype=np.float32)
+    return texts, vectors
+
+
+def make_queries(vectors, n_queries, rng):
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    noise = rng.normal(scale=0.05 * float(vectors.std()), size=(len(picks), vectors.shape[1]))
+    return (vectors[picks] + noise).astype(np.float32)
+
+
+def baseline(texts, vectors, queries, k, folder):
+    """Size, load time and exact neighbours of the LangChain FAISS layout."""
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, str(folder / "index.faiss"))
+    with open(folder / "index.pkl", "wb") as file:
+        pickle.dump([Document(page_content=text, metadata={"row": i}) for i, text in enumerate(texts)], file)
+
+    start = time.perf_counter()
+    faiss.read_index(str(folder / "index.faiss"))
+    with open(folder / "index.pkl", "rb") as file:
+        pickle.load(file)
+    load_time = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None], k)
+        latencies.append(time.perf_counter() - start)
+    _, truth = index.search(queries, k)
+    return {
+        "size": folder_size(folder),
+        "load": load_time,
+        "latency": statistics.median(latencies),
+        "recall": 1.0,
+    }, truth
+
+
+def evaluate(factory, texts, vectors, queries, truth, k, folder, train_size):
+    QuantizedFAISS.from_embeddings(
+        zip(texts, vectors),
+        None,
+        ({"row": i} for i in range(len(texts))),
+        folder_path=folder,
+        index_factory=factory,
+        train_size=train_size
+    )
+
+    start = time.perf_counter()
+    store = QuantizedFAISS.load_local(folder, None)
+    load_time = time.perf_counter() - start
+
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.similarity_search_with_score_by_vector(query, k)
+        latencies.append(time.perf_counter() - start)
+        found.append({document.metadata["row"] for document, _ in hits})
+    store.documents.close()
+
+    recall = statistics.mean(len(rows & set(expected)) / k for rows, expected in zip(found, truth.tolist()))
+    return {
+        "size": folder_size(folder),
+        "load": load_time,
+        "latency": statistics.median(latencies),
+        "recall": recall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector store storage options.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="CSV file whose rows are embedded with HuggingFaceEmbeddings.")
+    source.add_argument("--vectors", help="Precomputed embeddings, as a .npy matrix.")
+    source.add_argument("--synthetic", type=int, help="Number of random clustered vectors.")
+    parser.add_argument("--column", default="prompt", help="CSV column embedded.")
+    parser.add_argument("--texts", help="Text file with one document per line, for --vectors.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of the synthetic vectors.")
+    parser.add_argument("--factory", action="append", help="FAISS index factory string, can be repeated.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4, help="Neighbours retrieved per query.")
+    parser.add_argument("--train-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    texts, vectors = load_vectors(args)
+    queries = make_queries(vectors, args.queries, np.random.default_rng(1))
+    k = min(args.k, len(vectors))
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_vector_store_"))
+    try:
+        (workdir / "baseline").mkdir()
+        reference, truth = baseline(texts, vectors, queries, k, workdir / "baseline")
+        rows = [("flat float32 + pickle", reference)]
+        for factory in args.factory or DEFAULT_FACTORIES:
+            try:
+                rows.append((factory, evaluate(factory, texts, vectors, queries, truth, k, workdir / factory, args.train_size)))
+            except RuntimeError as e:
+                # e.g. not enough vectors to train a product quantizer
+                print(f"{factory}: skipped, {str(e).strip().splitlines()[-1]}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, recall@{k} on {len(queries)} queries")
+    print(f"{'storage':<24} {'size':>10} {'ratio':>7} {'load':>9} {'query':>9} {'recall':>7}")
+    for name, report in rows:
+        print(
+            f"{name:<24} {report['size'] / 2**20:>8.2f}MB {reference['size'] / report['size']:>6.1f}x "
+            f"{report['load'] * 1000:>7.1f}ms {report['latency'] * 1000:>7.2f}ms {report['recall']:>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
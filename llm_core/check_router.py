@@ -0,0 +1,149 @@
+"""
+Check the failover and hedging of the model router against the Groq stub.
+
+Each check starts a stub server, sends requests through RoutedChatModel and
+verifies the router's behaviour from what the stub observed:
+
+- failover: with rate_limit_ratio set, requests fail over to the next model
+  and succeed far more often than requests sent to a single model
+- hedging: when the preferred model becomes slow (model_latency), requests
+  are answered by the backup model shortly after the p95 latency
+- bounded hedging: with more slow requests than max_hedges, the extra ones
+  run without a backup instead of queueing behind the slower calls
+
+    python -m llm_core.check_router
+    python -m llm_core.check_router hedging
+
+The exit status is 1 if a check fails.
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_core.stub_server import StubConfig, StubServer
+
+# Models routed between in the checks
+MODEL_IDS = ["llama3-8b-8192", "gemma2-9b-it", "mixtral-8x7b-32768"]
+
+# Fast and slow stub latencies, in seconds
+FAST = 0.05
+SLOW = 1.5
+
+
+def routed_model(server, router):
+    from llm_core.router import RoutedChatModel
+
+    return RoutedChatModel(router=router, api_key="gsk_check", base_url=server.base_url, max_tokens=8)
+
+
+def warm_up(llm, requests=10):
+    """Send enough requests for every model's statistics to be trusted."""
+    for _ in range(requests):
+        llm.invoke("Hello")
+
+
+def answered_by(message):
+    return message.response_metadata.get("model_name")
+
+
+def check_failover(requests=60):
+    from langchain_groq import ChatGroq
+    from llm_core.router import ModelRouter
+
+    random.seed(0)
+    server = StubServer(config=StubConfig(latency=0.0, rate_limit_ratio=0.5, retry_after=0.0)).start()
+    try:
+        direct = ChatGroq(
+            model=MODEL_IDS[0], api_key="gsk_check", base_url=server.base_url, max_tokens=8, max_retries=0
+        )
+        routed = routed_model(server, ModelRouter(MODEL_IDS))
+        results = {}
+        for name, llm in (("direct", direct), ("routed", routed)):
+            failures = 0
+            for _ in range(requests):
+                try:
+                    llm.invoke("Hello")
+                except Exception:
+                    failures += 1
+            results[name] = failures / requests
+    finally:
+        server.stop()
+
+    # Three models each answering half of the requests: about 1 in 8 routed requests fails
+    ok = results["routed"] < 0.3 < results["direct"]
+    return ok, f"failure rate {results['direct']:.0%} direct, {results['routed']:.0%} routed"
+
+
+def check_hedging():
+    from llm_core.router import ModelRouter
+
+    server = StubServer(config=StubConfig(latency=FAST, tokens_per_second=10_000)).start()
+    try:
+        router = ModelRouter(MODEL_IDS[:2], hedge=True)
+        llm = routed_model(server, router)
+        warm_up(llm)
+
+        # The model the router prefers becomes slow
+        slow_model = router.candidates()[0]
+        server.config.model_latency[slow_model] = SLOW
+        start = time.perf_counter()
+        message = llm.invoke("Hello")
+        latency = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    ok = latency < SLOW / 2 and answered_by(message) != slow_model
+    return ok, f"answered by {answered_by(message)} in {latency:.2f}s while {slow_model} takes {SLOW}s"
+
+
+def check_bounded_hedging(max_hedges=2, concurrency=6):
+    from llm_core.router import ModelRouter
+
+    server = StubServer(config=StubConfig(latency=FAST, tokens_per_second=10_000)).start()
+    try:
+        router = ModelRouter(MODEL_IDS[:2], hedge=True, max_hedges=max_hedges)
+        llm = routed_model(server, router)
+        warm_up(llm)
+
+        slow_model = router.candidates()[0]
+        server.config.model_latency[slow_model] = SLOW
+
+        def timed(_):
+            start = time.perf_counter()
+            llm.invoke("Hello")
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, range(concurrency)))
+    finally:
+        server.stop()
+
+    hedged = sum(latency < SLOW / 2 for latency in latencies)
+    ok = hedged == max_hedges
+    return ok, f"{hedged} of {concurrency} concurrent slow requests hedged with max_hedges={max_hedges}"
+
+
+CHECKS = {
+    "failover": check_failover,
+    "hedging": check_hedging,
+    "bounded-hedging": check_bounded_hedging,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("checks", nargs="*", choices=[[], *CHECKS], help="Checks to run, all by default.")
+    args = parser.parse_args()
+
+    failed = 0
+    for name in args.checks or CHECKS:
+        ok, detail = CHECKS[name]()
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Settings of the shared infrastructure, in one place for every app.
+
+Each setting has a default suited to a single small server and can be
+overridden by an environment variable named LLM_CORE_ followed by the
+setting name in upper case, e.g.:
+
+    LLM_CORE_IO_WORKERS=32 LLM_CORE_MEMORY_LIMIT_MB=6000 streamlit run streamlit-ask-csv/main.py
+
+so a deployment running several apps is tuned and memory-bounded from its
+environment instead of from nine copies of the same constants.
+"""
+import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from pathlib import Path
+
+ENV_PREFIX = "LLM_CORE_"
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Parameters:
+    - cache_dir (Path): Directory of the persistent caches (chunk summaries).
+    - cpu_workers (int): Workers of the "cpu" pool, 0 for one per core.
+    - io_workers (int): Workers of the "io" pool, bounded to stay under the Groq rate limits.
+    - max_queued (int): Jobs waiting in a pool beyond which new ones are rejected.
+    - max_per_session (int): Jobs a session can have queued or running in a pool.
+    - max_background_per_session (int): Background jobs (prefetched rewrites, batch runs) a
+      session can have queued or running in a pool, on top of max_per_session.
+    - embedding_model (str): Hugging Face model of the embeddings.
+    - embedding_batch_size (int): Texts embedded per forward pass, and chunks per streamed batch.
+    - rerank_model (str): Cross-encoder reranking the retrieved chunks, a compact MS MARCO one fast on CPU.
+    - rerank_batch_size (int): Pairs scored per forward pass of the cross-encoder.
+    - chunk_size (int): Characters per chunk when splitting documents for retrieval.
+    - idle_seconds (float): Seconds an unused shared resource is kept in memory.
+    - memory_limit_mb (int): Resident memory above which unused resources are evicted, 0 for no limit.
+    """
+
+    cache_dir: Path = Path.home() / ".cache" / "llm_core"
+    cpu_workers: int = 0
+    io_workers: int = 16
+    max_queued: int = 64
+    max_per_session: int = 2
+    max_background_per_session: int = 4
+    embedding_model: str = "sentence-transformers/all-mpnet-base-v2"
+    embedding_batch_size: int = 64
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_batch_size: int = 32
+    chunk_size: int = 1000
+    idle_seconds: float = 1800.0
+    memory_limit_mb: int = 0
+
+
+def load_settings(environ=os.environ):
+    """
+    Read the settings from the environment.
+
+    Raises:
+    - ValueError: If a variable cannot be converted to the type of its setting.
+    """
+    values = {}
+    for setting in fields(Settings):
+        name = ENV_PREFIX + setting.name.upper()
+        if environ.get(name):
+            try:
+                values[setting.name] = setting.type(environ[name])
+            except ValueError:
+                raise ValueError(f"Invalid value for {name}: {environ[name]!r}") from None
+    return Settings(**values)
+
+
+@lru_cache(maxsize=None)
+def get_settings():
+    """Settings of the process, read from the environment on first use."""
+    return load_settings()
@@ -0,0 +1,411 @@
+"""
+Run controller for the CrewAI agents.
+
+A crew where every agent can delegate and use the same tools can spiral into
+long delegation chains that repeat the same searches and resend an ever
+growing transcript. A RunController bounds one run of a crew:
+
+- budgets: the run stops with BudgetExceededError once it has made
+  max_llm_calls model calls, used max_tokens tokens or run for
+  deadline seconds
+- tools: results are memoized in a store shared by every agent of the run,
+  keyed by the normalized tool input, and long observations are truncated
+- scratchpads: when a prompt grows past a share of the model window, the
+  older steps of the agent's scratchpad are replaced by their summary,
+  computed once per block of steps
+- usage: model calls and tokens are counted per agent
+
+Each agent gets its own wrapped model so its calls can be attributed:
+
+    controller = RunController(RunBudget(max_llm_calls=40), context_window=8192)
+    agent = Agent(..., llm=controller.wrap_llm(llm, "Online Researcher"), tools=controller.wrap_tools(tools))
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from llm_core.executor import check_cancelled
+from llm_core.models import DEFAULT_CONTEXT_WINDOW
+from llm_core.prompt_budget import estimate_tokens
+
+# Share of the model window a prompt can fill before its scratchpad is summarized
+SCRATCHPAD_RATIO = 0.6
+
+# Characters of a tool result shown to the agents
+MAX_OBSERVATION_CHARS = 4000
+
+# Steps of a scratchpad, each ending with the "Thought:" prompting the next one
+STEP_END = re.compile(r"\nThought:[ \t]*")
+
+# Instructions ending the task part of the CrewAI prompt, the scratchpad follows them
+TASK_END = "Begin!"
+
+SCRATCHPAD_TEMPLATE = """Summarize the following steps of an AI agent's work log.
+Keep every fact, figure, name and URL found, the searches and pages already tried,
+and the conclusions reached. Do not add anything.
+
+STEPS:
+{steps}
+
+SUMMARY:"""
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised when a run has used up one of its budgets."""
+
+
+@dataclass
+class RunBudget:
+    """
+    Limits of one crew run.
+
+    Parameters:
+    - max_llm_calls (int): Model calls, scratchpad summaries included.
+    - max_tokens (int): Prompt plus completion tokens.
+    - deadline (float): Seconds from the start of the run.
+    """
+
+    max_llm_calls: int = 60
+    max_tokens: int = 150_000
+    deadline: float = 300.0
+
+
+@dataclass
+class AgentUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    summaries: int = 0
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+def normalize_tool_input(value):
+    """Normalize a tool argument so that trivially different calls share a result."""
+    if isinstance(value, dict):
+        return {key: normalize_tool_input(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [normalize_tool_input(item) for item in value]
+    if not isinstance(value, str):
+        return value
+    text = " ".join(value.split()).strip("\"'")
+    if re.match(r"https?://", text, re.IGNORECASE):
+        parts = urlsplit(text)
+        # The fragment is never sent to the server
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", parts.query, ""))
+    return text.lower()
+
+
+def truncate_observation(result, max_chars=MAX_OBSERVATION_CHARS):
+    text = result if isinstance(result, str) else str(result)
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"\n[... {len(text) - max_chars} more characters truncated]"
+
+
+class ToolResultStore:
+    """
+    Memoized tool results shared by the agents of a run.
+
+    Concurrent calls with the same input wait for the first one instead of
+    repeating it. Errors are not stored, so a failed call can be retried.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tool_name, tool_input):
+        normalized = json.dumps(normalize_tool_input(tool_input), sort_keys=True, default=str)
+        return hashlib.sha256(f"{tool_name}\0{normalized}".encode()).hexdigest()
+
+    def call(self, tool_name, tool_input, fn):
+        """Return the stored result of the tool for this input, calling fn() to compute it once."""
+        key = self.key(tool_name, tool_input)
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._results[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def __len__(self):
+        return len(self._results)
+
+
+def split_steps(scratchpad):
+    """Split a scratchpad into steps, each ending with the "Thought:" prompting the next one."""
+    steps, start = [], 0
+    for match in STEP_END.finditer(scratchpad):
+        steps.append(scratchpad[start:match.end()])
+        start = match.end()
+    if start < len(scratchpad):
+        steps.append(scratchpad[start:])
+    return steps
+
+
+def group_steps(steps, block_chars):
+    """
+    Group steps greedily into blocks of about block_chars characters.
+
+    The blocks only depend on the steps before them, so the completed blocks
+    of a scratchpad stay the same as new steps are appended, and so do their
+    cached summaries.
+    """
+    blocks, current = [], ""
+    for step in steps:
+        if current and len(current) + len(step) > block_chars:
+            blocks.append(current)
+            current = ""
+        current += step
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+class RunController:
+    """
+    Budgets, shared tool results, scratchpad compaction and usage of one crew run.
+
+    Create one controller per run and start the run with run(), the deadline
+    runs from there.
+
+    Parameters:
+    - budget (RunBudget): Limits of the run, RunBudget() if None.
+    - context_window (int): Context window of the model, in tokens.
+    - scratchpad_ratio (float): Share of the window a prompt can fill before being compacted.
+    - max_observation_chars (int): Characters of a tool result shown to the agents.
+    """
+
+    def __init__(self, budget=None, context_window=DEFAULT_CONTEXT_WINDOW,
+                 scratchpad_ratio=SCRATCHPAD_RATIO, max_observation_chars=MAX_OBSERVATION_CHARS):
+        self.budget = budget or RunBudget()
+        self.max_prompt_tokens = int(context_window * scratchpad_ratio)
+        self.max_observation_chars = max_observation_chars
+        self.started = time.monotonic()
+        self.tools = ToolResultStore()
+        self.usage = {}
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs), e.g. crew.kickoff, starting the deadline now."""
+        self.started = time.monotonic()
+        return fn(*args, **kwargs)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def calls(self):
+        return sum(usage.calls for usage in self.usage.values())
+
+    @property
+    def tokens(self):
+        return sum(usage.tokens for usage in self.usage.values())
+
+    def check(self):
+        """
+        Stop the run if a budget is used up or its job has been cancelled.
+
+        Raises:
+        - BudgetExceededError: If the run is out of calls, tokens or time.
+        - JobCancelledError: If the run's job has been cancelled.
+        """
+        check_cancelled()
+        if self.calls >= self.budget.max_llm_calls:
+            raise BudgetExceededError(f"The run reached its limit of {self.budget.max_llm_calls} model calls.")
+        if self.tokens >= self.budget.max_tokens:
+            raise BudgetExceededError(f"The run reached its limit of {self.budget.max_tokens} tokens.")
+        if self.elapsed >= self.budget.deadline:
+            raise BudgetExceededError(f"The run reached its time limit of {self.budget.deadline:.0f} seconds.")
+
+    def record(self, agent, prompt_tokens, completion_tokens, summary=False):
+        with self._lock:
+            usage = self.usage.setdefault(agent, AgentUsage())
+            usage.calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+            usage.summaries += summary
+
+    def invoke(self, llm, agent, messages, summary=False, **kwargs):
+        """Call the model on behalf of an agent, within the budgets, and count the tokens used."""
+        self.check()
+        message = llm.invoke(messages, **kwargs)
+        prompt_tokens, completion_tokens = token_usage(message, messages)
+        self.record(agent, prompt_tokens, completion_tokens, summary=summary)
+        return message
+
+    def wrap_llm(self, llm, agent):
+        """Chat model calling llm on behalf of an agent, under the control of this run."""
+        return ControlledChatModel(inner=llm, controller=self, agent=agent)
+
+    def wrap_tools(self, tools):
+        """Tools sharing their results through the run's store, with truncated observations."""
+        return [self.wrap_tool(tool) for tool in tools]
+
+    def wrap_tool(self, tool):
+        from langchain_core.tools import StructuredTool, Tool
+
+        def run(tool_input):
+            self.check()
+            result = self.tools.call(tool.name, tool_input, lambda: tool.invoke(tool_input))
+            return truncate_observation(result, self.max_observation_chars)
+
+        if tool.args_schema is None:
+            return Tool(name=tool.name, description=tool.description, func=run)
+        return StructuredTool.from_function(
+            func=lambda **kwargs: run(kwargs),
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema
+        )
+
+    def _summarize_block(self, llm, agent, block):
+        key = hashlib.sha256(block.encode()).hexdigest()
+        with self._lock:
+            summary = self._summaries.get(key)
+        if summary is None:
+            message = self.invoke(
+                llm, f"{agent} (scratchpad)", [HumanMessage(content=SCRATCHPAD_TEMPLATE.format(steps=block))],
+                summary=True
+            )
+            summary = message.content.strip()
+            with self._lock:
+                self._summaries[key] = summary
+        return summary
+
+    def compact_text(self, llm, agent, text, max_tokens):
+        """
+        Fit a prompt in max_tokens by summarizing the older steps of its scratchpad.
+
+        The task instructions and the most recent steps are kept verbatim. Older
+        steps are summarized block by block, and each block summary is reused
+        by the following calls of the run.
+        """
+        start = text.find(TASK_END)
+        match = STEP_END.search(text, start) if start >= 0 else None
+        if match is None:
+            # Not a CrewAI agent prompt
+            return text
+        head, scratchpad = text[:match.end()], text[match.end():]
+
+        max_chars = max(max_tokens - estimate_tokens(head), 0) * 4
+        blocks = group_steps(split_steps(scratchpad), max(max_chars // 4, 1))
+        # Keep the recent blocks verbatim while they fit in half of the room left
+        recent = [blocks.pop()]
+        while blocks and sum(map(len, recent)) + len(blocks[-1]) <= max_chars // 2:
+            recent.insert(0, blocks.pop())
+        if not blocks:
+            return text
+
+        summaries = [self._summarize_block(llm, agent, block) for block in blocks]
+        return (
+            head
+            + "I have already done the following steps, summarized:\n"
+            + "\n".join(summaries)
+            + "\nThought: "
+            + "".join(recent)
+        )
+
+    def compact_messages(self, llm, agent, messages):
+        """Compact the longest message when the prompt fills more than its share of the window."""
+        total = sum(estimate_tokens(str(message.content)) for message in messages)
+        if total <= self.max_prompt_tokens:
+            return messages
+        index = max(range(len(messages)), key=lambda i: len(str(messages[i].content)))
+        message = messages[index]
+        if not isinstance(message.content, str):
+            return messages
+        room = self.max_prompt_tokens - (total - estimate_tokens(message.content))
+        content = self.compact_text(llm, agent, message.content, room)
+        if content is message.content:
+            return messages
+        return messages[:index] + [message.copy(update={"content": content})] + messages[index + 1:]
+
+    def report(self):
+        """Usage per agent, as rows ready for st.dataframe or a log."""
+        rows = [
+            {
+                "agent": agent,
+                "calls": usage.calls,
+                "prompt tokens": usage.prompt_tokens,
+                "completion tokens": usage.completion_tokens,
+            }
+            for agent, usage in sorted(self.usage.items())
+        ]
+        rows.append({
+            "agent": "Total",
+            "calls": self.calls,
+            "prompt tokens": sum(usage.prompt_tokens for usage in self.usage.values()),
+            "completion tokens": sum(usage.completion_tokens for usage in self.usage.values()),
+        })
+        return rows
+
+
+def token_usage(message, messages):
+    """Prompt and completion tokens of a model answer, estimated when the API does not report them."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    prompt = sum(estimate_tokens(str(item.content)) for item in messages)
+    return prompt, estimate_tokens(str(message.content))
+
+
+class ControlledChatModel(BaseChatModel):
+    """
+    Chat model forwarding to another one on behalf of an agent of a controlled run.
+
+    Every call is checked against the run budgets, counted for the agent and
+    made with a compacted prompt when the agent's scratchpad has grown too long.
+    """
+
+    inner: Any
+    controller: Any
+    agent: str
+
+    @property
+    def _llm_type(self):
+        return "controlled-" + getattr(self.inner, "_llm_type", "chat")
+
+    @property
+    def model_name(self):
+        return getattr(self.inner, "model_name", self._llm_type)
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        messages = self.controller.compact_messages(self.inner, self.agent, messages)
+        message = self.controller.invoke(self.inner, self.agent, messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
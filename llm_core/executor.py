@@ -0,0 +1,522 @@
+"""
+Shared execution service for the apps deployed behind one Streamlit server.
+
+Heavy work leaves the Streamlit script thread and runs in two bounded pools,
+shared by every session of the process:
+
+- "cpu" for CPU-bound work (embedding, PDF parsing), one worker per core by default
+- "io" for I/O-bound work (LLM calls, web search), more workers than cores
+
+Each pool serves the sessions round-robin, so one user uploading ten PDFs
+does not delay everybody else. Admission control rejects new work when a
+pool queue, or a session's share of it, is full, instead of letting latency
+grow without bound. The jobs of a session that disconnects are cancelled.
+
+From a Streamlit script, run_job() submits a function, shows its position
+in the queue while it waits and cancels it if the script is stopped or rerun:
+
+    store = run_job("cpu", FAISS.from_documents, documents, embeddings)
+    answer = run_job("io", chain.invoke, question, label="Thinking...")
+
+Work made of many model calls (chunk summaries, batches of posts) submits
+each call as its own job with map_jobs(), so it never holds more than the
+session's share of the pool and never starts threads of its own:
+
+    for index, future in map_jobs("io", summarize, chunks):
+        ...
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError as FutureTimeoutError, wait
+from functools import lru_cache
+
+# Seconds between two checks of the sessions that are still connected
+WATCH_INTERVAL = 2.0
+
+# Seconds between two refreshes of the queue position shown in the app
+POLL_INTERVAL = 0.5
+
+POOL_LABELS = {"cpu": "processing", "io": "model"}
+
+# Shown to the user when admission control rejects a job
+SERVICE_BUSY_MESSAGE = "⚠️ The server is busy right now. Please try again in a moment."
+
+# Thread attribute where Streamlit keeps the ScriptRunContext of a thread
+SCRIPT_RUN_CTX_ATTR = "streamlit_script_run_ctx"
+
+_local = threading.local()
+
+
+class ServiceBusyError(RuntimeError):
+    """Raised when a job is rejected by admission control."""
+
+
+class JobCancelledError(RuntimeError):
+    """Raised by check_cancelled() in a job that has been cancelled."""
+
+
+def job_cancelled():
+    """Tell whether the job running in the current thread has been cancelled."""
+    job = getattr(_local, "job", None)
+    return job is not None and job.cancel_event.is_set()
+
+
+def check_cancelled():
+    """
+    Stop the current job if it has been cancelled.
+
+    Threads cannot be interrupted, so long jobs call this between steps
+    (e.g. between two LLM calls) to stop early once their session is gone.
+    Does nothing outside of a job.
+
+    Raises:
+    - JobCancelledError: If the current job has been cancelled.
+    """
+    if job_cancelled():
+        raise JobCancelledError("The job was cancelled.")
+
+
+def current_session_id():
+    """
+    Session the work of the current thread is done for.
+
+    Inside a job, its session; in a session_scope() block, the session of the
+    block; in a Streamlit script thread, the Streamlit session; otherwise "default".
+    """
+    job = getattr(_local, "job", None)
+    if job is not None:
+        return job.session_id
+    session_id = getattr(_local, "session_id", None)
+    if session_id is not None:
+        return session_id
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return "default"
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else "default"
+
+
+class session_scope:
+    """Context manager making the current thread work for session_id, e.g. a virtual user of a load test."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+    def __enter__(self):
+        self._previous = getattr(_local, "session_id", None)
+        _local.session_id = self.session_id
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.session_id = self._previous
+
+
+class Job:
+    """A function submitted to a pool, with a Future holding its result."""
+
+    def __init__(self, pool, session_id, fn, args, kwargs, background=False):
+        self.pool = pool
+        self.session_id = session_id
+        self.background = background
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.cancel_event = threading.Event()
+        self.submitted = time.monotonic()
+        self.started = None
+
+    @property
+    def position(self):
+        """Approximate number of jobs dispatched before this one, None once it is no longer queued."""
+        return self.pool.position(self)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """Drop the job if it is queued, or ask it to stop if it is running."""
+        self.pool.cancel(self)
+
+
+class FairPool:
+    """
+    Bounded pool of worker threads serving the sessions round-robin.
+
+    Parameters:
+    - name (str): Name of the pool, used in thread names.
+    - workers (int): Number of worker threads.
+    - max_queued (int): Jobs waiting beyond which submit() is rejected.
+    - max_per_session (int): Jobs a session can have queued or running.
+    - max_background_per_session (int): Background jobs a session can have queued or
+      running, counted apart from the other ones so they never block them.
+    """
+
+    def __init__(self, name, workers, max_queued, max_per_session, max_background_per_session=None):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_session = max_per_session
+        self.max_background_per_session = max_background_per_session or max_per_session
+        self._queues = OrderedDict()
+        self._running = {}
+        self._queued = 0
+        self._condition = threading.Condition()
+        for index in range(workers):
+            threading.Thread(target=self._work, name=f"{name}-worker-{index}", daemon=True).start()
+
+    def submit(self, session_id, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on behalf of a session.
+
+        Raises:
+        - ServiceBusyError: If the pool queue or the session's share of the pool is full.
+        """
+        return self._submit(session_id, False, fn, args, kwargs)
+
+    def submit_background(self, session_id, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) as background work of a session (prefetching,
+        batch runs), within max_background_per_session instead of max_per_session.
+
+        Raises:
+        - ServiceBusyError: If the pool queue or the session's background share is full.
+        """
+        return self._submit(session_id, True, fn, args, kwargs)
+
+    def _submit(self, session_id, background, fn, args, kwargs):
+        limit = self.max_background_per_session if background else self.max_per_session
+        with self._condition:
+            if self._queued >= self.max_queued:
+                raise ServiceBusyError(f"The {self.name} queue is full.")
+            jobs = (*self._queues.get(session_id, ()), *self._running.get(session_id, ()))
+            if sum(job.background == background for job in jobs) >= limit:
+                raise ServiceBusyError(f"Too many {self.name} jobs for this session.")
+            job = Job(self, session_id, fn, args, kwargs, background)
+            self._queues.setdefault(session_id, deque()).append(job)
+            self._queued += 1
+            self._condition.notify()
+        return job
+
+    def _next_job(self):
+        # Called with the condition held: take the oldest job of the next
+        # session, then move that session to the back of the rotation
+        session_id, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[session_id]
+        if queue:
+            self._queues[session_id] = queue
+        self._queued -= 1
+        self._running.setdefault(session_id, set()).add(job)
+        return job
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queues:
+                    self._condition.wait()
+                job = self._next_job()
+
+            if job.future.set_running_or_notify_cancel():
+                job.started = time.monotonic()
+                _local.job = job
+                try:
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+                finally:
+                    _local.job = None
+
+            with self._condition:
+                running = self._running.get(job.session_id)
+                running.discard(job)
+                if not running:
+                    del self._running[job.session_id]
+
+    def position(self, job):
+        with self._condition:
+            queue = self._queues.get(job.session_id)
+            if not queue or job not in queue:
+                return None
+            index = queue.index(job)
+            # Round-robin: every other session gets up to index + 1 turns first
+            return index + sum(
+                min(len(other), index + 1)
+                for session_id, other in self._queues.items()
+                if session_id != job.session_id
+            )
+
+    def cancel(self, job):
+        job.cancel_event.set()
+        with self._condition:
+            queue = self._queues.get(job.session_id)
+            if queue and job in queue:
+                queue.remove(job)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[job.session_id]
+        job.future.cancel()
+
+    def jobs(self, session_id):
+        """Queued and running jobs of a session."""
+        with self._condition:
+            return list(self._queues.get(session_id, ())) + list(self._running.get(session_id, ()))
+
+    def sessions(self):
+        with self._condition:
+            return set(self._queues) | set(self._running)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": sum(len(jobs) for jobs in self._running.values()),
+                "sessions": len(set(self._queues) | set(self._running)),
+            }
+
+
+def streamlit_session_alive(session_id):
+    """Tell whether a Streamlit session is still connected, True outside of a server."""
+    try:
+        from streamlit.runtime import Runtime
+    except ImportError:
+        return True
+    if not Runtime.exists():
+        return True
+    return Runtime.instance().is_active_session(session_id)
+
+
+class ExecutionService:
+    """
+    The CPU and I/O pools, and a watcher cancelling the jobs of disconnected sessions.
+
+    The sizes have no defaults here, get_service() takes them from the settings.
+
+    Parameters:
+    - cpu_workers (int): Workers of the "cpu" pool, one per core if 0 or None.
+    - io_workers (int): Workers of the "io" pool.
+    - max_queued (int): Jobs waiting in a pool beyond which new ones are rejected.
+    - max_per_session (int): Jobs a session can have queued or running in a pool.
+    - max_background_per_session (int): Background jobs a session can have queued or
+      running in a pool, max_per_session if None.
+    - session_alive (callable): Tells whether a session ID is still connected.
+    """
+
+    def __init__(
+        self,
+        cpu_workers,
+        io_workers,
+        max_queued,
+        max_per_session,
+        max_background_per_session=None,
+        session_alive=streamlit_session_alive,
+    ):
+        cpu_workers = cpu_workers or os.cpu_count() or 2
+        self.pools = {
+            "cpu": FairPool("cpu", cpu_workers, max_queued, max_per_session, max_background_per_session),
+            "io": FairPool("io", io_workers, max_queued, max_per_session, max_background_per_session),
+        }
+        self.session_alive = session_alive
+        threading.Thread(target=self._watch, name="session-watcher", daemon=True).start()
+
+    def submit(self, pool, session_id, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) in the "cpu" or "io" pool and return its Job."""
+        return self.pools[pool].submit(session_id, fn, *args, **kwargs)
+
+    def submit_background(self, pool, session_id, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) as background work in the "cpu" or "io" pool and return its Job."""
+        return self.pools[pool].submit_background(session_id, fn, *args, **kwargs)
+
+    def cancel_session(self, session_id):
+        for pool in self.pools.values():
+            for job in pool.jobs(session_id):
+                job.cancel()
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def _watch(self):
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            sessions = set().union(*(pool.sessions() for pool in self.pools.values()))
+            for session_id in sessions:
+                try:
+                    alive = self.session_alive(session_id)
+                except Exception:
+                    alive = True
+                if not alive:
+                    self.cancel_session(session_id)
+
+
+@lru_cache(maxsize=None)
+def get_service():
+    """Service shared by every session of the process, sized by the settings (see llm_core.config)."""
+    from llm_core.config import get_settings
+
+    settings = get_settings()
+    return ExecutionService(
+        cpu_workers=settings.cpu_workers,
+        io_workers=settings.io_workers,
+        max_queued=settings.max_queued,
+        max_per_session=settings.max_per_session,
+        max_background_per_session=settings.max_background_per_session,
+    )
+
+
+def _completed_future(fn, *args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def map_jobs(pool, fn, items, limit=None, background=False, throttle=None):
+    """
+    Run fn(item) for each item as jobs of the current session, yielding them as they complete.
+
+    At most the session's share of the pool (max_per_session, or
+    max_background_per_session for background jobs), or limit if lower, is
+    queued or running at a time, so a long list of model calls cannot take
+    more slots than a single user is entitled to. Called from inside a job,
+    which already holds one of the session's slots, the items run one after
+    another in the job's own thread. Pending jobs are cancelled if the caller
+    stops iterating, e.g. on a Streamlit rerun.
+
+    Parameters:
+    - pool (str): "cpu" or "io".
+    - fn (callable): Function called with one item.
+    - items (iterable): Arguments of fn.
+    - limit (int): Maximum number of jobs in flight, the session's share if None.
+    - background (bool): Submit the jobs as background work (see FairPool.submit_background).
+    - throttle (callable): Called before each submit, returns the seconds to wait before
+      the next job may start, or 0 to start it now, e.g. RateLimiter.delay. The jobs
+      are held back in the caller's thread, so they never hold a slot while waiting.
+
+    Yields:
+    - (int, Future): Index of the item and its completed Future, in order of completion.
+
+    Raises:
+    - ServiceBusyError: If the pool queue is full and none of the items is in flight.
+    """
+    if getattr(_local, "job", None) is not None:
+        for index, item in enumerate(items):
+            check_cancelled()
+            delay = throttle() if throttle is not None else 0
+            while delay > 0:
+                time.sleep(delay)
+                delay = throttle()
+            yield index, _completed_future(fn, item)
+        return
+
+    service = get_service()
+    session_id = current_session_id()
+    fair_pool = service.pools[pool]
+    share = fair_pool.max_background_per_session if background else fair_pool.max_per_session
+    limit = min(limit or share, share)
+    submit = service.submit_background if background else service.submit
+    pending = deque(enumerate(items))
+    running = {}
+    try:
+        while pending or running:
+            delay = 0
+            while pending and len(running) < limit:
+                delay = throttle() if throttle is not None else 0
+                if delay > 0:
+                    break
+                index, item = pending[0]
+                try:
+                    job = submit(pool, session_id, fn, item)
+                except ServiceBusyError:
+                    # Other jobs of the session, or of everybody, hold the slots: wait for ours
+                    if not running:
+                        raise
+                    break
+                pending.popleft()
+                running[job.future] = (index, job)
+            timeout = min(delay, POLL_INTERVAL) if delay > 0 else POLL_INTERVAL
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, _ = running.pop(future)
+                yield index, future
+    finally:
+        for _, job in running.values():
+            job.cancel()
+
+
+def _with_script_run_ctx(ctx, fn):
+    """Wrap fn so it can write Streamlit elements of the session from a worker thread."""
+    from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+    def call(*args, **kwargs):
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Do not keep the session alive through an idle worker
+            if hasattr(thread, SCRIPT_RUN_CTX_ATTR):
+                setattr(thread, SCRIPT_RUN_CTX_ATTR, None)
+
+    return call
+
+
+def run_job(pool, fn, *args, label="Working on it...", **kwargs):
+    """
+    Run fn(*args, **kwargs) in a pool of the shared service from a Streamlit script.
+
+    While the job waits, the app shows its position in the queue; once it
+    runs, a spinner. fn may write Streamlit elements, e.g. a progress bar.
+    The job is cancelled if the script is stopped or rerun before it ends.
+    When the service is saturated, a warning is shown and the script stops.
+
+    Parameters:
+    - pool (str): "cpu" or "io".
+    - fn (callable): Function to run.
+    - label (str): Spinner text while the job runs.
+
+    Returns:
+    - The return value of fn.
+    """
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else "default"
+    try:
+        job = get_service().submit(pool, session_id, _with_script_run_ctx(ctx, fn), *args, **kwargs)
+    except ServiceBusyError:
+        st.warning(SERVICE_BUSY_MESSAGE)
+        st.stop()
+
+    placeholder = st.empty()
+    try:
+        with st.spinner(label):
+            while True:
+                try:
+                    return job.result(timeout=POLL_INTERVAL)
+                except FutureTimeoutError:
+                    pass
+                position = job.position
+                if position is not None:
+                    placeholder.info(
+                        f"⏳ Waiting for a free {POOL_LABELS.get(pool, pool)} slot: "
+                        f"{position} request(s) ahead of yours."
+                    )
+                else:
+                    placeholder.empty()
+    finally:
+        placeholder.empty()
+        if not job.done():
+            job.cancel()
@@ -0,0 +1,124 @@
+"""
+Folders replaced as a whole while other sessions may be reading them.
+
+A published folder holds its versions and a CURRENT file naming the current
+one:
+
+    vector_db/
+        CURRENT             "v-k3j2h1"
+        v-k3j2h1/           index.faiss, index.pkl, ...
+        v-9x8w7v/           replaced version, kept for readers still opening it
+
+A new version is built in a hidden folder next to them (new_version()), then
+published by replacing CURRENT in a single atomic rename (publish_folder()).
+Readers resolve the folder once with current_version() and read every file
+from the version it names, so they see either the old or the new version,
+never a missing or half-written one. A folder saved directly, without
+CURRENT, is its own current version.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# File naming the current version of a published folder
+CURRENT_FILE = "CURRENT"
+
+# Prefixes of the versions being built and of the published ones
+BUILD_PREFIX = ".build-"
+VERSION_PREFIX = "v-"
+
+# Seconds a replaced version is kept for the readers that resolved it before the swap
+RETIRED_SECONDS = 300.0
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def folder_lock(folder_path):
+    """
+    Lock of a folder, shared by the threads of the process building or checking it.
+
+    Reentrant, so a caller checking whether the folder exists can hold it
+    while building and publishing a new version.
+    """
+    key = Path(folder_path).resolve()
+    with _locks_lock:
+        return _locks.setdefault(key, threading.RLock())
+
+
+def _read_current(folder):
+    try:
+        return (folder / CURRENT_FILE).read_text().strip() or None
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def current_version(folder_path):
+    """
+    Folder holding the current version of folder_path.
+
+    Returns:
+    - Path: The version named by CURRENT, folder_path itself if it was saved
+      directly, or None if it holds neither.
+    """
+    folder = Path(folder_path)
+    version = _read_current(folder)
+    if version is not None:
+        return folder / version
+    if folder.is_dir() and any(entry.is_file() for entry in folder.iterdir()):
+        return folder
+    return None
+
+
+def new_version(folder_path):
+    """Create an empty folder to build the next version of folder_path in, then publish it with publish_folder()."""
+    folder = Path(folder_path)
+    folder.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=BUILD_PREFIX, dir=folder))
+
+
+def publish_folder(build_path, folder_path):
+    """
+    Make a folder created by new_version() the current version of folder_path.
+
+    Replaced versions are kept RETIRED_SECONDS for the readers that
+    resolved them just before a swap, then removed, as are the files of a
+    folder saved directly once it has been published twice.
+
+    Returns:
+    - Path: The published version.
+    """
+    folder, build_path = Path(folder_path), Path(build_path)
+    version = VERSION_PREFIX + build_path.name[len(BUILD_PREFIX):]
+    with folder_lock(folder):
+        os.replace(build_path, folder / version)
+        previous = _read_current(folder)
+        pointer = folder / f".{CURRENT_FILE}.{version}"
+        pointer.write_text(version)
+        os.replace(pointer, folder / CURRENT_FILE)
+
+        now = time.time()
+        if previous is not None:
+            # The modification time of a version is the time it was replaced
+            os.utime(folder / previous, (now, now))
+        for entry in folder.iterdir():
+            if entry.name in (CURRENT_FILE, version) or entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                if now - entry.stat().st_mtime > RETIRED_SECONDS:
+                    shutil.rmtree(entry, ignore_errors=True)
+            elif previous is not None:
+                # Files of the folder saved directly, replaced by the first published version
+                entry.unlink(missing_ok=True)
+    return folder / version
+
+
+def folder_size(folder_path):
+    """Total size of the files of the current version of a folder, in bytes."""
+    folder = current_version(folder_path)
+    if folder is None:
+        return 0
+    return sum(os.path.getsize(path) for path in folder.iterdir() if path.is_file())
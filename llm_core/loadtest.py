@@ -0,0 +1,474 @@
+"""
+Load test of the app pipelines against the local Groq stand-in.
+
+Starts llm_core.stub_server, then drives the Streamlit-free pipeline
+functions of streamlit-ask-csv, streamlit-qa-from-document and
+streamlit-split-and-summarize at increasing concurrency. For each level it
+reports throughput, latency percentiles, CPU and resident memory per stage:
+
+    python -m llm_core.loadtest --scenario ask-csv --concurrency 1,4,16 --requests 40
+    python -m llm_core.loadtest --scenario split-and-summarize --latency 0.5 --rate-limit-ratio 0.05
+    python -m llm_core.loadtest --scenario qa-from-document --service --json > baseline.json
+
+--service sends every stage through the shared execution service, in the
+pool the app uses, with one session per virtual user. --embeddings hashing
+replaces the Hugging Face model by a cheap deterministic one, to measure the
+rest of the pipeline alone; split-and-summarize does not embed anything and
+never loads it.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from llm_core.executor import session_scope
+from llm_core.resources import rss_bytes
+from llm_core.stub_server import StubConfig, StubServer
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Words of the generated documents
+VOCABULARY = (
+    "emperor army battle campaign treaty france europe revolution consul code "
+    "empire coalition navy island exile victory defeat reform law state"
+).split()
+
+# Seconds between two memory samples
+SAMPLE_INTERVAL = 0.1
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def make_text(n_paragraphs, rng, salt=""):
+    """Random paragraphs, each prefixed with salt so that nothing is reused from the caches."""
+    return "\n\n".join(
+        f"{salt}" + " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(60, 160))) + "."
+        for _ in range(n_paragraphs)
+    )
+
+
+def make_pdf(text, lines_per_page=45, line_length=90):
+    """Minimal PDF file with the text in Helvetica, without any PDF library."""
+    words, lines, line = text.split(), [], ""
+    for word in words:
+        if len(line) + len(word) + 1 > line_length:
+            lines.append(line)
+            line = ""
+        line = f"{line} {word}".strip()
+    lines.append(line)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[""]]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        stream = "BT /F1 10 Tf 50 780 Td 14 TL " + " ".join(
+            "(" + text_line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '"
+            for text_line in page
+        ) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("latin-1"))
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return output.getvalue()
+
+
+class HashingEmbeddings(Embeddings):
+    """Cheap deterministic bag-of-words embeddings, to take the embedding model out of a test."""
+
+    def __init__(self, size=384):
+        self.size = size
+
+    def embed_query(self, text):
+        vector = [0.0] * self.size
+        for word in text.lower().split():
+            vector[zlib.crc32(word.encode()) % self.size] += 1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def import_app_module(app_dir, module):
+    """Import a module of an app directory, as `streamlit run` would find it."""
+    path = str(ROOT / app_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(module)
+
+
+class Recorder:
+    """
+    Wall time, CPU time and memory of each stage of each request.
+
+    Besides the growth of the resident memory over each run of a stage, the
+    memory samples taken while a stage is running give its peak, so stages
+    running concurrently can be told apart.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.cpu = defaultdict(list)
+        self.rss_growth = defaultdict(list)
+        self.rss_peak = defaultdict(int)
+        self._running = Counter()
+        self._lock = threading.Lock()
+
+    def start(self, stage):
+        with self._lock:
+            self._running[stage] += 1
+            self.rss_peak[stage] = max(self.rss_peak[stage], rss_bytes())
+
+    def add(self, stage, wall, cpu, rss_growth):
+        with self._lock:
+            self._running[stage] -= 1
+            self.samples[stage].append(wall)
+            self.cpu[stage].append(cpu)
+            self.rss_growth[stage].append(rss_growth)
+
+    def sample_memory(self, rss):
+        """Record a memory sample against the stages running when it was taken."""
+        with self._lock:
+            for stage, running in self._running.items():
+                if running:
+                    self.rss_peak[stage] = max(self.rss_peak[stage], rss)
+
+
+class Scenario(ABC):
+    """
+    One app pipeline under load.
+
+    setup() runs once before the test, request() once per simulated request
+    and calls stage() around each step, which times it and, with --service,
+    runs it in the pool the app uses.
+    """
+
+    name = ""
+    stage_pools = {}
+    # Whether the scenario embeds documents, so the embedding model is only loaded when needed
+    needs_embeddings = True
+
+    def __init__(self, args, llm, embeddings, reranker, workdir):
+        self.args = args
+        self.llm = llm
+        self.embeddings = embeddings
+        self.reranker = reranker
+        self.workdir = workdir
+        self.recorder = Recorder()
+        self.service = None
+        if args.service:
+            from llm_core.executor import get_service
+
+            self.service = get_service()
+
+    def setup(self):
+        pass
+
+    @abstractmethod
+    def request(self, index, session_id):
+        """Run one request of the simulated user session_id, index counting the requests."""
+
+    def stage(self, name, session_id, fn, *args, **kwargs):
+        cpu = []
+
+        def timed():
+            start = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cpu.append(time.thread_time() - start)
+
+        rss_before = rss_bytes()
+        self.recorder.start(name)
+        start = time.perf_counter()
+        pool = self.stage_pools.get(name)
+        if self.service is not None and pool:
+            result = self.service.submit(pool, session_id, timed).result()
+        else:
+            # Steps that fan out to the pools themselves, as the session of the virtual user
+            with session_scope(session_id):
+                result = timed()
+        self.recorder.add(name, time.perf_counter() - start, cpu[0] if cpu else 0.0, rss_bytes() - rss_before)
+        return result
+
+
+class AskCsvScenario(Scenario):
+    name = "ask-csv"
+    stage_pools = {"retrieve": "io", "generate": "io"}
+
+    def setup(self):
+        faq_pipeline = import_app_module("streamlit-ask-csv", "faq_pipeline")
+
+        folder = self.workdir / "vector_db"
+        faq_pipeline.create_db(self.args.csv, self.embeddings, str(folder), compressed=self.args.compressed)
+        vectordb = faq_pipeline.load_db(str(folder), self.embeddings, compressed=self.args.compressed)
+        self.chain = faq_pipeline.build_chain(vectordb, self.llm, reranker=self.reranker)
+
+        import csv
+        with open(self.args.csv, newline="", encoding="utf-8") as file:
+            self.questions = [row["prompt"] for row in csv.DictReader(file)] or ["Who are you?"]
+
+    def request(self, index, session_id):
+        question = self.questions[index % len(self.questions)]
+        # The two steps of RetrievalQA, timed separately
+        documents = self.stage("retrieve", session_id, self.chain.retriever.invoke, question)
+        self.stage(
+            "generate", session_id, self.chain.combine_documents_chain.invoke,
+            {"input_documents": documents, "question": question}
+        )
+
+
+class QaFromDocumentScenario(Scenario):
+    name = "qa-from-document"
+    stage_pools = {"build_store": "cpu", "answer": "io"}
+
+    def setup(self):
+        self.pdf_pipeline = import_app_module("streamlit-qa-from-document", "pdf_pipeline")
+        if self.args.pdf:
+            self.pdf = Path(self.args.pdf).read_bytes()
+        else:
+            self.pdf = make_pdf(make_text(self.args.paragraphs, random.Random(0)))
+
+    def request(self, index, session_id):
+        store = self.stage("build_store", session_id, self.pdf_pipeline.build_store, io.BytesIO(self.pdf), self.embeddings)
+        self.stage(
+            "answer", session_id, self.pdf_pipeline.answer_question,
+            store, self.llm, random.choice(VOCABULARY) + "?", self.reranker
+        )
+
+
+class SplitAndSummarizeScenario(Scenario):
+    name = "split-and-summarize"
+    # Summarizing submits one "io" job per chunk
+    stage_pools = {}
+    needs_embeddings = False
+
+    def setup(self):
+        from llm_core.summarize import SummaryCache
+
+        self.summary_pipeline = import_app_module("streamlit-split-and-summarize", "summary_pipeline")
+        self.cache = SummaryCache(self.workdir / "summaries.sqlite3")
+
+    def request(self, index, session_id):
+        # A different salt per request, so the chunk summaries are never reused
+        text = make_text(self.args.paragraphs, random.Random(index), salt=f"[{index}-{time.time_ns()}] ")
+        chunks = self.stage("split", session_id, self.summary_pipeline.split_document, io.BytesIO(text.encode()))
+        self.stage("summarize", session_id, self.summary_pipeline.summarize_chunks, self.llm, self.args.model, chunks, cache=self.cache)
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (AskCsvScenario, QaFromDocumentScenario, SplitAndSummarizeScenario)}
+
+
+@contextmanager
+def memory_sampler(on_sample=None):
+    """
+    Sample the resident memory in the background, yielding a dict updated with the peak.
+
+    Parameters:
+    - on_sample (callable): Called with each sample, e.g. Recorder.sample_memory.
+    """
+    stats = {"peak": rss_bytes()}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(SAMPLE_INTERVAL):
+            rss = rss_bytes()
+            stats["peak"] = max(stats["peak"], rss)
+            if on_sample is not None:
+                on_sample(rss)
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        yield stats
+    finally:
+        stop.set()
+        thread.join()
+        stats["end"] = rss_bytes()
+
+
+def run_level(scenario, concurrency, n_requests, server):
+    """Run n_requests requests, concurrency at a time, and measure them."""
+    scenario.recorder = Recorder()
+    totals, errors = [], Counter()
+    lock = threading.Lock()
+    requests_before, rate_limited_before = server.requests, server.rate_limited
+
+    def one(index):
+        # One session per virtual user, i.e. per thread running the requests
+        session_id = threading.current_thread().name
+        start = time.perf_counter()
+        try:
+            scenario.request(index, session_id)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        with lock:
+            totals.append(time.perf_counter() - start)
+
+    cpu_before = os.times()
+    start = time.perf_counter()
+    with memory_sampler(scenario.recorder.sample_memory) as memory:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="user") as executor:
+            list(executor.map(one, range(n_requests)))
+    wall = time.perf_counter() - start
+    cpu_after = os.times()
+    cpu = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "ok": len(totals),
+        "errors": dict(errors),
+        "wall": wall,
+        "throughput": len(totals) / wall,
+        "latency": {
+            "p50": percentile(totals, 0.5),
+            "p90": percentile(totals, 0.9),
+            "p99": percentile(totals, 0.99),
+        },
+        "stages": {
+            stage: {
+                "p50": percentile(samples, 0.5),
+                "p90": percentile(samples, 0.9),
+                "p99": percentile(samples, 0.99),
+                "cpu": statistics.mean(scenario.recorder.cpu[stage]),
+                "rss_peak": scenario.recorder.rss_peak[stage],
+                "rss_growth": statistics.mean(scenario.recorder.rss_growth[stage]),
+            }
+            for stage, samples in scenario.recorder.samples.items()
+        },
+        "cpu_percent": 100 * cpu / wall,
+        "rss_peak": memory["peak"],
+        "rss_end": memory["end"],
+        "llm_requests": server.requests - requests_before,
+        "rate_limited": server.rate_limited - rate_limited_before,
+    }
+
+
+def print_report(scenario_name, levels):
+    print(f"Scenario {scenario_name}")
+    print(
+        f"{'conc':>5} {'ok':>5} {'err':>5} {'req/s':>7} {'p50':>8} {'p90':>8} {'p99':>8} "
+        f"{'cpu':>6} {'rss peak':>9} {'llm':>6} {'429':>5}"
+    )
+    for level in levels:
+        latency = level["latency"]
+        print(
+            f"{level['concurrency']:>5} {level['ok']:>5} {sum(level['errors'].values()):>5} "
+            f"{level['throughput']:>7.2f} {latency['p50']:>7.2f}s {latency['p90']:>7.2f}s {latency['p99']:>7.2f}s "
+            f"{level['cpu_percent']:>5.0f}% {level['rss_peak'] / 2**20:>7.0f}MB "
+            f"{level['llm_requests']:>6} {level['rate_limited']:>5}"
+        )
+        for stage, stats in level["stages"].items():
+            print(
+                f"{'':>5} {stage:<17} p50 {stats['p50']:.3f}s  p90 {stats['p90']:.3f}s  "
+                f"p99 {stats['p99']:.3f}s  cpu {stats['cpu'] * 1000:.0f}ms/request  "
+                f"rss peak {stats['rss_peak'] / 2**20:.0f}MB  growth {stats['rss_growth'] / 2**20:+.1f}MB/request"
+            )
+        if level["errors"]:
+            print(f"{'':>5} errors: {level['errors']}")
+
+
+def load_embeddings(name):
+    if name == "hashing":
+        return HashingEmbeddings()
+    from llm_core import resources
+
+    # The configured model, as in the apps
+    return resources.embeddings()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app pipelines against a local Groq stub.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="ask-csv")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=0, help="Requests per level, 4 x concurrency (at least 10) by default.")
+    parser.add_argument("--model", default="llama3-8b-8192", help="Model ID, or \"auto\" for the model router.")
+    parser.add_argument("--embeddings", choices=["huggingface", "hashing"], default="huggingface")
+    parser.add_argument("--rerank", action="store_true", help="Rerank the retrieved chunks with the cross-encoder.")
+    parser.add_argument("--compressed", action="store_true", help="Use the compressed vector database in ask-csv.")
+    parser.add_argument("--service", action="store_true", help="Run the stages through the shared execution service.")
+    parser.add_argument("--csv", default=str(ROOT / "streamlit-ask-csv" / "napoleon-faqs.csv"))
+    parser.add_argument("--pdf", help="PDF file for qa-from-document, a generated one by default.")
+    parser.add_argument("--paragraphs", type=int, default=60, help="Paragraphs of the generated documents.")
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub seconds before the first token.")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Stub relative spread of the latency.")
+    parser.add_argument("--tokens-per-second", type=float, default=800.0, help="Stub output throughput.")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of stub requests answered with 429.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args()
+
+    server = StubServer(config=StubConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_ratio=args.rate_limit_ratio,
+    )).start()
+    # Clients created from here on, including the router's, talk to the stub
+    os.environ["GROQ_BASE_URL"] = server.base_url
+
+    from llm_core.router import load_chat_model
+
+    llm = load_chat_model(args.model, "gsk_load_test", temperature=0)
+    reranker = None
+    if args.rerank:
+        from llm_core.rerank import CrossEncoderReranker
+
+        reranker = CrossEncoderReranker()
+
+    levels = []
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as workdir:
+        scenario_class = SCENARIOS[args.scenario]
+        embeddings = load_embeddings(args.embeddings) if scenario_class.needs_embeddings else None
+        scenario = scenario_class(args, llm, embeddings, reranker, Path(workdir))
+        scenario.setup()
+        for concurrency in (int(value) for value in args.concurrency.split(",")):
+            n_requests = args.requests or max(4 * concurrency, 10)
+            levels.append(run_level(scenario, concurrency, n_requests, server))
+            if not args.json:
+                print_report(args.scenario, levels[-1:])
+    server.stop()
+
+    if args.json:
+        print(json.dumps({"scenario": args.scenario, "args": vars(args), "levels": levels}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
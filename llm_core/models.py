@@ -0,0 +1,31 @@
+# Model options shown in the apps, label -> Groq model ID
+MODELS = {
+    "LLaMA3 8b": "llama3-8b-8192",
+    "LLaMA3 70b": "llama3-70b-8192",
+    "Mixtral 8x7b": "mixtral-8x7b-32768",
+    "Gemma 7b": "gemma-7b-it",
+    "Gemma2 9b": "gemma2-9b-it"
+}
+
+# Model ID that lets the router pick the fastest healthy model
+AUTO_MODEL_ID = "auto"
+
+# Model options including the routed one, label -> model ID
+MODEL_OPTIONS = {
+    **MODELS,
+    "⚡ Auto (fastest available)": AUTO_MODEL_ID
+}
+
+# Context window of each Groq model, in tokens
+CONTEXT_WINDOWS = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "gemma-7b-it": 8192,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+def context_window(model_id):
+    return CONTEXT_WINDOWS.get(model_id, DEFAULT_CONTEXT_WINDOW)
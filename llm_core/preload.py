@@ -0,0 +1,38 @@
+import importlib
+import threading
+
+# Targets already handed to a preload thread in this process
+_started = set()
+_lock = threading.Lock()
+
+
+def _load(targets):
+    for target in targets:
+        try:
+            if callable(target):
+                target()
+            else:
+                importlib.import_module(target)
+        except Exception:
+            # The import is attempted again, and fails loudly, on first use
+            pass
+
+
+def preload(*targets):
+    """
+    Import heavy modules in a background thread while the page renders.
+
+    The apps import their heavy dependencies inside the functions that use
+    them, so the first paint does not wait for them. Calling preload() right
+    after the page header is written warms those imports up before the user
+    has finished filling in the form. Each target is loaded once per process,
+    whatever the number of sessions and reruns.
+
+    Parameters:
+    - targets (str or callable): Module names to import, or functions to call.
+    """
+    with _lock:
+        pending = [target for target in targets if target not in _started]
+        _started.update(pending)
+    if pending:
+        threading.Thread(target=_load, args=(pending,), name="preload", daemon=True).start()
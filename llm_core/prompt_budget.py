@@ -0,0 +1,125 @@
+from functools import lru_cache
+
+from llm_core.models import context_window
+
+# The Groq models use their own tokenizers. cl100k_base is a close estimate,
+# the safety margin absorbs the difference and the chat formatting tokens.
+SAFETY_MARGIN = 0.05
+
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    """Load the tokenizer on first use, it is not needed to render the page."""
+    import tiktoken
+
+    return tiktoken.get_encoding("cl100k_base")
+
+
+class PromptTooLongError(ValueError):
+    """Raised when an input does not fit in the model context window."""
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text))
+
+
+def estimate_tokens(text):
+    """Cheap token estimate, without the tokenizer, for budgets that need not be exact."""
+    # About four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens."""
+    tokens = get_encoding().encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[:max(max_tokens, 0)])
+
+
+class PromptBudget:
+    """
+    Token budget for one or more variants of a PromptTemplate.
+
+    The fixed part of every variant is tokenized once, the first time the
+    budget is used, so fitting an input only costs tokenizing the input itself.
+    When values of the other variables are given, the prompt is formatted
+    with them and an empty input instead, so a variable used several times
+    in the template is counted each time.
+    Variants are ordered from the richest (e.g. full few-shot examples) to the
+    most compact; fit() picks the first one that leaves room for the input.
+
+    Parameters:
+    - prompts (PromptTemplate): Prompt variants, richest first.
+    - input_variable (str): Name of the variable holding the user input.
+    """
+
+    def __init__(self, *prompts, input_variable):
+        self.prompts = prompts
+        self.input_variable = input_variable
+        self._template_tokens = None
+
+    @property
+    def template_tokens(self):
+        """Number of tokens of each variant without its variables."""
+        if self._template_tokens is None:
+            self._template_tokens = [
+                count_tokens(prompt.format(**{name: "" for name in prompt.input_variables}))
+                for prompt in self.prompts
+            ]
+        return self._template_tokens
+
+    def prompt_tokens(self, variant=-1, **values):
+        """Number of tokens of a variant formatted with values and without the input."""
+        if not values:
+            return self.template_tokens[variant]
+        prompt = self.prompts[variant]
+        variables = {name: "" for name in prompt.input_variables}
+        variables.update(values)
+        variables[self.input_variable] = ""
+        return count_tokens(prompt.format(**variables))
+
+    def available_tokens(self, model_id, max_output_tokens, variant=-1, **values):
+        """
+        Return the number of tokens left for the input in the given variant.
+
+        Parameters:
+        - model_id (str): ID of the model the prompt is sent to.
+        - max_output_tokens (int): Tokens reserved for the model response.
+        - variant (int): Index of the prompt variant, the most compact by default.
+        - values (str): Values of the other prompt variables.
+        """
+        usable = int(context_window(model_id) * (1 - SAFETY_MARGIN))
+        return usable - self.prompt_tokens(variant, **values) - max_output_tokens
+
+    def fit(self, model_id, text, max_output_tokens, truncate=False, **values):
+        """
+        Choose the richest prompt variant that fits text within the budget.
+
+        Parameters:
+        - model_id (str): ID of the model the prompt is sent to.
+        - text (str): The user input.
+        - max_output_tokens (int): Tokens reserved for the model response.
+        - truncate (bool): Truncate text to the most compact variant instead of
+          raising when it does not fit in any variant.
+        - values (str): Values of the other prompt variables.
+
+        Returns:
+        - tuple: The selected PromptTemplate and the (possibly truncated) text.
+
+        Raises:
+        - PromptTooLongError: If text does not fit and truncate is False.
+        """
+        text_tokens = count_tokens(text)
+        for variant, prompt in enumerate(self.prompts):
+            available = self.available_tokens(model_id, max_output_tokens, variant, **values)
+            if text_tokens <= available:
+                return prompt, text
+
+        available = self.available_tokens(model_id, max_output_tokens, **values)
+        if not truncate or available <= 0:
+            raise PromptTooLongError(
+                f"The input has {text_tokens} tokens but only {max(available, 0)} "
+                f"are available for {model_id}."
+            )
+        return self.prompts[-1], truncate_tokens(text, available)
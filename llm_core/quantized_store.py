@@ -0,0 +1,384 @@
+"""
+Compact FAISS vector store for large collections.
+
+LangChain's FAISS store keeps full float32 vectors in a flat index and
+pickles every Document, text included, in index.pkl, all loaded in memory.
+QuantizedFAISS instead:
+
+- compresses the vectors with any FAISS index factory string, e.g. "SQ8"
+  (scalar int8, 4x smaller), "PQ64" (product quantization, 64 bytes per
+  vector) or "PCA256,SQ8" (trained PCA down to 256 dimensions, then int8)
+- stores the documents as zlib-compressed JSON blocks in docs.bin, with an
+  offset index, and only reads and decompresses the blocks of the hits
+
+The folder layout is index.faiss, docs.bin, docs.idx.npz and store.json.
+Building into a folder publishes a new version of it (see llm_core.folders),
+so stores already open in other sessions keep reading their own files.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from itertools import islice, repeat
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from llm_core.config import get_settings
+from llm_core.folders import current_version, new_version, publish_folder
+
+# Vectors used to train the quantizer and the PCA before the rest is added
+DEFAULT_TRAIN_SIZE = 50_000
+
+# Documents per compressed block of docs.bin
+DEFAULT_BLOCK_SIZE = 64
+
+# Decompressed blocks kept in memory for repeated hits
+BLOCK_CACHE_SIZE = 32
+
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docs.bin"
+DOCS_INDEX_FILE = "docs.idx.npz"
+STORE_FILE = "store.json"
+
+
+class DocumentBlob:
+    """
+    Append-only file of documents, compressed by blocks and read on demand.
+
+    Only the block offsets are held in memory: 16 bytes per block of
+    block_size documents.
+
+    Parameters:
+    - path (str or Path): The docs.bin file.
+    - block_size (int): Documents per block for the appended documents.
+    """
+
+    def __init__(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        self.path = Path(path)
+        self.block_size = block_size
+        self.offsets = np.zeros(1, dtype=np.uint64)
+        self.block_starts = np.zeros(0, dtype=np.int64)
+        self.count = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def open(cls, path, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Open a saved blob for reading.
+
+        The file is opened right away, so the blob keeps reading the same
+        documents if the folder is replaced by a rebuild afterwards.
+        """
+        blob = cls(path, block_size)
+        blob._file = open(blob.path, "rb")
+        with np.load(blob.path.with_name(DOCS_INDEX_FILE)) as index:
+            blob.offsets = index["offsets"]
+            blob.block_starts = index["block_starts"]
+            blob.count = int(index["count"])
+        if os.fstat(blob._file.fileno()).st_size != int(blob.offsets[-1]):
+            blob.close()
+            raise ValueError(f"{blob.path} does not match its offset index, it may have been rebuilt meanwhile.")
+        return blob
+
+    def append(self, documents):
+        """Write documents as new blocks and return their positions."""
+        documents = list(documents)
+        first = self.count
+        offsets, starts = [], []
+        with open(self.path, "ab") as file:
+            end = int(self.offsets[-1])
+            for start in range(0, len(documents), self.block_size):
+                block = [
+                    [document.page_content, document.metadata]
+                    for document in documents[start:start + self.block_size]
+                ]
+                data = zlib.compress(json.dumps(block, ensure_ascii=False).encode())
+                file.write(data)
+                starts.append(self.count)
+                end += len(data)
+                offsets.append(end)
+                self.count += len(block)
+        with self._lock:
+            self.offsets = np.concatenate([self.offsets, np.array(offsets, dtype=np.uint64)])
+            self.block_starts = np.concatenate([self.block_starts, np.array(starts, dtype=np.int64)])
+        return list(range(first, self.count))
+
+    def save_index(self):
+        np.savez(
+            self.path.with_name(DOCS_INDEX_FILE),
+            offsets=self.offsets,
+            block_starts=self.block_starts,
+            count=np.int64(self.count)
+        )
+
+    def _read_block(self, block):
+        # Called with the lock held
+        if block in self._cache:
+            self._cache.move_to_end(block)
+            return self._cache[block]
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        start, end = int(self.offsets[block]), int(self.offsets[block + 1])
+        self._file.seek(start)
+        records = json.loads(zlib.decompress(self._file.read(end - start)))
+        self._cache[block] = records
+        while len(self._cache) > BLOCK_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return records
+
+    def get(self, positions):
+        """Return the documents at the given positions."""
+        documents = []
+        with self._lock:
+            for position in positions:
+                block = int(np.searchsorted(self.block_starts, position, side="right")) - 1
+                text, metadata = self._read_block(block)[position - int(self.block_starts[block])]
+                documents.append(Document(page_content=text, metadata=metadata))
+        return documents
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _skip_polysemous_training(index):
+    # Polysemous codes only speed up Hamming-filtered search, which is not used,
+    # and training them takes minutes
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPQ):
+        index.do_polysemous_training = False
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class QuantizedFAISS(VectorStore):
+    """
+    FAISS vector store with compressed vectors and on-disk compressed documents.
+
+    Build it with from_texts() or from_embeddings(), which stream the input
+    so the full float32 matrix is never held in memory, and reopen it with
+    load_local(). Scores are L2 distances, as in LangChain's FAISS store.
+
+    Parameters:
+    - embedding (Embeddings): Model embedding the queries, and the added texts.
+    - index: Trained faiss index.
+    - documents (DocumentBlob): Documents stored in the same order as the vectors.
+    - index_factory (str): Factory string the index was built with.
+    - nprobe (int): Inverted lists visited per query, for IVF indexes.
+    """
+
+    def __init__(self, embedding, index, documents, index_factory, nprobe=None):
+        self.embedding = embedding
+        self.index = index
+        self.documents = documents
+        self.index_factory = index_factory
+        if nprobe is not None and "IVF" in index_factory:
+            faiss.ParameterSpace().set_index_parameter(index, "nprobe", nprobe)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    @property
+    def folder_path(self):
+        return self.documents.path.parent
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def add_embeddings(self, text_embeddings, metadatas=None):
+        """Add (text, vector) pairs to a trained store and return their IDs."""
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        metadatas = metadatas or [{} for _ in text_embeddings]
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        self.index.add(vectors)
+        positions = self.documents.append(
+            Document(page_content=text, metadata=metadata or {})
+            for (text, _), metadata in zip(text_embeddings, metadatas)
+        )
+        return [str(position) for position in positions]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        batch_size = get_settings().embedding_batch_size
+        ids = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            vectors = self.embedding.embed_documents(batch)
+            ids += self.add_embeddings(
+                zip(batch, vectors),
+                metadatas[start:start + batch_size] if metadatas else None
+            )
+        return ids
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        distances, positions = self.index.search(np.asarray([embedding], dtype=np.float32), k)
+        hits = [(int(position), float(distance)) for position, distance in zip(positions[0], distances[0]) if position >= 0]
+        documents = self.documents.get([position for position, _ in hits])
+        return [(document, distance) for document, (_, distance) in zip(documents, hits)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @classmethod
+    def _build(cls, batches, embedding, folder_path, index_factory, train_size, block_size):
+        """Train the index on the first train_size vectors, then stream the others in."""
+        if folder_path is None:
+            build_path = Path(tempfile.mkdtemp(prefix="quantized_faiss_"))
+        else:
+            # Built as a new version of the folder, published once complete
+            build_path = new_version(folder_path)
+        documents = DocumentBlob(build_path / DOCS_FILE, block_size)
+
+        try:
+            store, pending = None, []
+            for batch in batches:
+                if store is not None:
+                    store.add_embeddings(*batch)
+                    continue
+                pending.append(batch)
+                if sum(len(texts_vectors) for texts_vectors, _ in pending) >= train_size:
+                    store = cls._train(pending, embedding, documents, index_factory)
+            if store is None:
+                if not pending:
+                    raise ValueError("Cannot build a vector store without any text.")
+                store = cls._train(pending, embedding, documents, index_factory)
+            store.save_local(build_path)
+        except BaseException:
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise
+        if folder_path is None:
+            # Nothing else refers to the temporary folder, it goes away with the store
+            weakref.finalize(store, shutil.rmtree, build_path, True)
+        else:
+            version = publish_folder(build_path, folder_path)
+            store.documents.close()
+            store.documents = DocumentBlob.open(version / DOCS_FILE, block_size)
+        return store
+
+    @classmethod
+    def _train(cls, batches, embedding, documents, index_factory):
+        vectors = np.asarray([vector for text_embeddings, _ in batches for _, vector in text_embeddings], dtype=np.float32)
+        index = faiss.index_factory(vectors.shape[1], index_factory)
+        _skip_polysemous_training(index)
+        if not index.is_trained:
+            index.train(vectors)
+        store = cls(embedding, index, documents, index_factory)
+        for text_embeddings, metadatas in batches:
+            store.add_embeddings(text_embeddings, metadatas)
+        return store
+
+    @classmethod
+    def from_embeddings(cls, text_embeddings, embedding, metadatas=None, folder_path=None,
+                        index_factory="SQ8", train_size=DEFAULT_TRAIN_SIZE,
+                        block_size=DEFAULT_BLOCK_SIZE, **kwargs):
+        """
+        Build a store from precomputed (text, vector) pairs.
+
+        Parameters:
+        - text_embeddings (iterable): (text, vector) pairs, consumed lazily.
+        - embedding (Embeddings): Model embedding the queries.
+        - metadatas (iterable of dict): Metadata of each text.
+        - folder_path (str or Path): Folder the store is published to, a temporary one
+          removed with the store if None.
+        - index_factory (str): FAISS index factory string, e.g. "SQ8", "PQ64", "PCA256,SQ8".
+        - train_size (int): Vectors used to train the quantizer and the PCA.
+        - block_size (int): Documents per compressed block.
+
+        Returns:
+        - QuantizedFAISS: The store, already saved in folder_path.
+        """
+        pairs = zip(text_embeddings, metadatas if metadatas is not None else repeat({}))
+        batches = (
+            ([pair for pair, _ in batch], [metadata for _, metadata in batch])
+            for batch in _batched(pairs, get_settings().embedding_batch_size)
+        )
+        return cls._build(batches, embedding, folder_path, index_factory, train_size, block_size)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], embedding: Embeddings, metadatas: Optional[Iterable[dict]] = None,
+                   folder_path=None, index_factory="SQ8", train_size=DEFAULT_TRAIN_SIZE,
+                   block_size=DEFAULT_BLOCK_SIZE, **kwargs: Any) -> "QuantizedFAISS":
+        """Embed texts batch by batch and build a store, see from_embeddings()."""
+        pairs = zip(texts, metadatas if metadatas is not None else repeat({}))
+        batches = (
+            (list(zip([text for text, _ in batch], embedding.embed_documents([text for text, _ in batch]))),
+             [metadata for _, metadata in batch])
+            for batch in _batched(pairs, get_settings().embedding_batch_size)
+        )
+        return cls._build(batches, embedding, folder_path, index_factory, train_size, block_size)
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], embedding: Embeddings, **kwargs: Any) -> "QuantizedFAISS":
+        return cls.from_texts(
+            (document.page_content for document in documents),
+            embedding,
+            (document.metadata for document in documents),
+            **kwargs
+        )
+
+    def save_local(self, folder_path):
+        """Write the index and document offsets to folder_path, copying docs.bin if needed."""
+        folder_path = Path(folder_path)
+        folder_path.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self.index, str(folder_path / INDEX_FILE))
+        self.documents.save_index()
+        if folder_path.resolve() != self.folder_path.resolve():
+            shutil.copyfile(self.documents.path, folder_path / DOCS_FILE)
+            shutil.copyfile(self.documents.path.with_name(DOCS_INDEX_FILE), folder_path / DOCS_INDEX_FILE)
+        with open(folder_path / STORE_FILE, "w") as file:
+            json.dump({
+                "index_factory": self.index_factory,
+                "block_size": self.documents.block_size,
+                "count": self.documents.count,
+            }, file)
+
+    @classmethod
+    def load_local(cls, folder_path, embeddings, nprobe=None, mmap=False):
+        """
+        Open a store written by save_local(), or the current version of a
+        folder it was published to.
+
+        Parameters:
+        - folder_path (str or Path): Folder of the store.
+        - embeddings (Embeddings): Model embedding the queries.
+        - nprobe (int): Inverted lists visited per query, for IVF indexes.
+        - mmap (bool): Map the index file instead of reading it in memory,
+          for indexes that support it.
+        """
+        folder = current_version(folder_path)
+        if folder is None:
+            raise FileNotFoundError(f"No vector store in {folder_path}.")
+        with open(folder / STORE_FILE) as file:
+            settings = json.load(file)
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(str(folder / INDEX_FILE), flags)
+        documents = DocumentBlob.open(folder / DOCS_FILE, settings["block_size"])
+        return cls(embeddings, index, documents, settings["index_factory"], nprobe)
@@ -0,0 +1,197 @@
+"""
+Post-retrieval stage for the RAG apps.
+
+The vector store is asked for more candidates than the prompt can hold, then:
+
+1. near-duplicate chunks are dropped, comparing MinHash signatures of their word shingles
+2. the remaining chunks are reranked by a small cross-encoder running on CPU
+3. the best chunks are packed into a token budget
+
+so the "stuff" chains receive fewer, more relevant and non-redundant chunks.
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from llm_core.config import get_settings
+from llm_core.prompt_budget import estimate_tokens
+
+# Candidates fetched from the vector store before deduplication and reranking
+DEFAULT_FETCH_K = 20
+
+# Estimated Jaccard similarity above which two chunks are considered duplicates
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+
+# Words per shingle and permutations per MinHash signature
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+
+# Prime larger than any 32-bit shingle hash, for the permutations a * x + b mod p
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0)
+_PERM_A = _rng.integers(1, 1 << 31, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Return the set of hashed word n-grams of a text."""
+    words = text.lower().split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode())}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(text):
+    """MinHash signature of the shingles of a text, comparable with np.mean(a == b)."""
+    hashes = np.fromiter(shingles(text), dtype=np.uint64)
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+def deduplicate(documents, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """
+    Drop documents nearly identical to an earlier one.
+
+    Documents are kept in their order, so the first (best ranked) copy wins.
+
+    Parameters:
+    - documents (list of Document): Candidates, best first.
+    - threshold (float): Estimated Jaccard similarity of the shingles above which
+      a document is a duplicate.
+
+    Returns:
+    - list of Document: The distinct documents.
+    """
+    kept, signatures = [], []
+    for document in documents:
+        signature = minhash_signature(document.page_content)
+        if any(np.mean(signature == other) >= threshold for other in signatures):
+            continue
+        kept.append(document)
+        signatures.append(signature)
+    return kept
+
+
+def pack(documents, max_tokens, max_documents=None, length_function=estimate_tokens):
+    """
+    Take the documents in order while they fit in max_tokens.
+
+    A document too long for the remaining budget is skipped, so a shorter one
+    ranked after it can still be used. If no document fits, the first one is
+    returned alone rather than an empty context.
+    """
+    packed, used = [], 0
+    for document in documents:
+        if max_documents is not None and len(packed) >= max_documents:
+            break
+        tokens = length_function(document.page_content)
+        if used + tokens > max_tokens:
+            continue
+        packed.append(document)
+        used += tokens
+    return packed or documents[:1]
+
+
+class CrossEncoderReranker:
+    """
+    Score (query, passage) pairs with a sentence-transformers cross-encoder.
+
+    Pairs are scored in batches and the scores are kept in an LRU cache, so
+    a question asked again, or candidates shared between similar questions,
+    are not scored twice. The model is loaded on first use.
+
+    Parameters:
+    - model_name (str): Hugging Face ID of the cross-encoder, the configured one by default.
+    - batch_size (int): Pairs scored per forward pass, the configured number by default.
+    - cache_size (int): Scores kept in memory.
+    """
+
+    def __init__(self, model_name=None, batch_size=None, cache_size=4096):
+        settings = get_settings()
+        self.model_name = model_name or settings.rerank_model
+        self.batch_size = batch_size or settings.rerank_batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            with self._lock:
+                if self._model is None:
+                    self._model = CrossEncoder(self.model_name, max_length=512, device="cpu")
+        return self._model
+
+    @staticmethod
+    def _key(query, passage):
+        return hashlib.sha1(f"{query}\0{passage}".encode()).digest()
+
+    def score(self, query, passages):
+        """Return the relevance score of each passage for the query."""
+        keys = [self._key(query, passage) for passage in passages]
+        scores = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+
+        missing = {key: passage for key, passage in zip(keys, passages) if key not in scores}
+        if missing:
+            predicted = self.model.predict(
+                [(query, passage) for passage in missing.values()],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            with self._lock:
+                for key, value in zip(missing, predicted):
+                    scores[key] = self._cache[key] = float(value)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [scores[key] for key in keys]
+
+    def rerank(self, query, documents):
+        """Sort documents by decreasing relevance, storing the score in their metadata."""
+        scores = self.score(query, [document.page_content for document in documents])
+        ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)
+        return [
+            Document(page_content=document.page_content, metadata={**document.metadata, "rerank_score": score})
+            for document, score in ranked
+        ]
+
+
+class PostRetrievalRetriever(BaseRetriever):
+    """
+    Retriever deduplicating, reranking and packing the results of another one.
+
+    The base retriever should return more candidates than needed, e.g.
+    vectorstore.as_retriever(search_kwargs={"k": DEFAULT_FETCH_K}).
+    """
+
+    base_retriever: BaseRetriever
+    reranker: Optional[Any] = None
+    """CrossEncoderReranker, or None to keep the base retriever's order."""
+    duplicate_threshold: float = DEFAULT_DUPLICATE_THRESHOLD
+    max_tokens: int = 2000
+    """Token budget of the packed documents."""
+    max_documents: Optional[int] = None
+    length_function: Callable[[str], int] = estimate_tokens
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        documents = deduplicate(documents, self.duplicate_threshold)
+        if self.reranker is not None and len(documents) > 1:
+            documents = self.reranker.rerank(query, documents)
+        return pack(documents, self.max_tokens, self.max_documents, self.length_function)
@@ -0,0 +1,321 @@
+"""
+Registry of the heavy objects shared by every app and session of a process.
+
+LLM clients, embedding models, rerankers and vector stores are expensive to
+create and some take hundreds of megabytes. The registry creates each of
+them on first use, shares it between the apps deployed in the same process
+and frees it again:
+
+- lazy initialization: a resource is created by its factory the first time
+  it is asked for, once even when several sessions ask at the same time
+- reference counting: a resource used through lease(), or got inside a
+  leases() block, is never evicted while the lease is held
+- idle eviction: resources unused for idle_seconds are dropped
+- memory pressure: when the process goes over memory_limit, unused
+  resources are dropped, least recently used first
+
+    from llm_core import resources
+
+    with resources.leases():
+        embeddings = resources.embeddings()
+        llm = resources.chat_model(model_id, api_key, temperature=0)
+        run_job("io", answer, embeddings, llm, question)
+
+Resources are evicted by dropping the registry's reference, so objects still
+referenced by a running job stay alive until the job ends.
+"""
+import gc
+import hashlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from llm_core.config import get_settings
+
+# Seconds between two checks for idle resources and memory pressure
+REAP_INTERVAL = 30.0
+
+
+def rss_bytes():
+    """
+    Resident memory of the process, or its peak where the current value is not available.
+
+    Returns 0 where neither is (e.g. on Windows), which disables the memory limit.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Resource:
+    """A shared object with its usage, as kept by the registry."""
+
+    def __init__(self, key):
+        self.key = key
+        self.value = None
+        self.ready = False
+        self.refs = 0
+        self.created = None
+        self.last_used = time.monotonic()
+        # Growth of the resident memory while the object was created
+        self.size = 0
+        self.lock = threading.Lock()
+
+
+class ResourceRegistry:
+    """
+    Lazily created, reference counted and evictable shared objects.
+
+    Parameters:
+    - idle_seconds (float): Seconds an unreferenced resource is kept after its last use.
+    - memory_limit (int): Resident memory, in bytes, above which unreferenced
+      resources are evicted; 0 for no limit.
+    - reap_interval (float): Seconds between two background eviction passes.
+    """
+
+    def __init__(self, idle_seconds, memory_limit, reap_interval=REAP_INTERVAL):
+        self.idle_seconds = idle_seconds
+        self.memory_limit = memory_limit
+        self.reap_interval = reap_interval
+        self._resources = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        # Resources leased by the leases() block of each thread
+        self._local = threading.local()
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._resources.get(key)
+            if entry is None:
+                entry = self._resources[key] = Resource(key)
+            if self._reaper is None and self.reap_interval:
+                self._reaper = threading.Thread(target=self._reap, name="resource-reaper", daemon=True)
+                self._reaper.start()
+            return entry
+
+    def _load(self, key, factory, lease):
+        while True:
+            entry = self._entry(key)
+            with entry.lock:
+                with self._lock:
+                    if self._resources.get(key) is not entry:
+                        # Evicted while we were waiting for it
+                        continue
+                    entry.last_used = time.monotonic()
+                    entry.refs += lease
+                if entry.ready:
+                    return entry, entry.value
+                before = rss_bytes()
+                try:
+                    entry.value = factory()
+                except BaseException:
+                    with self._lock:
+                        entry.refs -= lease
+                        if self._resources.get(key) is entry and not entry.refs:
+                            del self._resources[key]
+                    raise
+                entry.size = max(rss_bytes() - before, 0)
+                entry.created = time.monotonic()
+                entry.ready = True
+                value = entry.value
+            # The caller gets the object even if it is evicted right away
+            self.relieve_memory_pressure()
+            return entry, value
+
+    def get(self, key, factory):
+        """
+        Return the resource of key, creating it with factory() on first use.
+
+        The resource may be evicted once it is idle, unless it is got inside
+        a leases() block, which leases it until the block exits.
+        """
+        scope = getattr(self._local, "scope", None)
+        if scope is None:
+            return self._load(key, factory, lease=0)[1]
+        entry, value = self._load(key, factory, lease=1)
+        scope.append(entry)
+        return value
+
+    @contextmanager
+    def lease(self, key, factory):
+        """Use the resource of key, protected from eviction until the block exits."""
+        entry, value = self._load(key, factory, lease=1)
+        try:
+            yield value
+        finally:
+            self._release([entry])
+
+    @contextmanager
+    def leases(self):
+        """
+        Lease every resource got by the current thread until the block exits.
+
+        Wraps a request, e.g. a Streamlit script run, so the models and
+        stores it uses are not evicted while its jobs are running.
+        """
+        previous = getattr(self._local, "scope", None)
+        scope = self._local.scope = []
+        try:
+            yield
+        finally:
+            self._local.scope = previous
+            self._release(scope)
+
+    def _release(self, entries):
+        now = time.monotonic()
+        with self._lock:
+            for entry in entries:
+                entry.refs -= 1
+                entry.last_used = now
+
+    def evict(self, key):
+        """Drop a resource, e.g. a vector store whose files have been rebuilt."""
+        with self._lock:
+            entry = self._resources.pop(key, None)
+        if entry is not None:
+            self._close(entry)
+
+    def _close(self, entry):
+        # Only the registry's reference is dropped, a job still using the object keeps it alive
+        entry.value = None
+
+    def _evictable(self):
+        # Called with the lock held: unreferenced resources, least recently used first
+        return sorted(
+            (entry for entry in self._resources.values() if entry.ready and not entry.refs),
+            key=lambda entry: entry.last_used
+        )
+
+    def evict_idle(self):
+        """Drop the unreferenced resources unused for idle_seconds, and return their keys."""
+        now = time.monotonic()
+        with self._lock:
+            evicted = [entry for entry in self._evictable() if now - entry.last_used >= self.idle_seconds]
+            for entry in evicted:
+                del self._resources[entry.key]
+        for entry in evicted:
+            self._close(entry)
+        return [entry.key for entry in evicted]
+
+    def relieve_memory_pressure(self):
+        """Drop unreferenced resources, least recently used first, until under memory_limit."""
+        if not self.memory_limit:
+            return []
+        excess = rss_bytes() - self.memory_limit
+        if excess <= 0:
+            return []
+        evicted = []
+        with self._lock:
+            for entry in self._evictable():
+                if excess <= 0:
+                    break
+                del self._resources[entry.key]
+                evicted.append(entry)
+                excess -= entry.size
+        for entry in evicted:
+            self._close(entry)
+        if evicted:
+            gc.collect()
+        return [entry.key for entry in evicted]
+
+    def _reap(self):
+        while True:
+            time.sleep(self.reap_interval)
+            self.evict_idle()
+            self.relieve_memory_pressure()
+
+    def stats(self):
+        """Key, references, idle seconds and estimated size of every resource."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": entry.key,
+                    "refs": entry.refs,
+                    "idle": now - entry.last_used,
+                    "size": entry.size,
+                }
+                for entry in self._resources.values() if entry.ready
+            ]
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._resources.get(key)
+            return entry is not None and entry.ready
+
+
+@lru_cache(maxsize=None)
+def get_registry():
+    """Registry shared by every app and session of the process, sized by the settings."""
+    settings = get_settings()
+    return ResourceRegistry(
+        idle_seconds=settings.idle_seconds,
+        memory_limit=settings.memory_limit_mb * 2**20,
+    )
+
+
+def leases():
+    """Lease the resources got by the current thread until the block exits, see ResourceRegistry.leases."""
+    return get_registry().leases()
+
+
+def chat_model(model_id, api_key, temperature=0, **kwargs):
+    """
+    Shared chat model for a model ID and API key, see llm_core.router.load_chat_model.
+
+    Sessions using the same key and parameters share one client and its
+    connection pool.
+    """
+    from llm_core.router import load_chat_model
+
+    # The key is only kept by the factory, not in the registry's keys and stats
+    key_digest = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    key = ("chat_model", model_id, key_digest, temperature, tuple(sorted(kwargs.items())))
+    return get_registry().get(key, lambda: load_chat_model(model_id, api_key, temperature=temperature, **kwargs))
+
+
+def embeddings(model_name=None):
+    """Shared Hugging Face embedding model, the configured one by default."""
+    settings = get_settings()
+    model_name = model_name or settings.embedding_model
+
+    def load():
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"batch_size": settings.embedding_batch_size}
+        )
+
+    return get_registry().get(("embeddings", model_name), load)
+
+
+def reranker(model_name=None):
+    """Shared cross-encoder reranker, the configured one by default."""
+    settings = get_settings()
+    model_name = model_name or settings.rerank_model
+
+    def load():
+        from llm_core.rerank import CrossEncoderReranker
+
+        return CrossEncoderReranker(model_name, settings.rerank_batch_size)
+
+    return get_registry().get(("reranker", model_name), load)
+
+
+def vector_store(name, factory):
+    """Shared vector store loaded by factory(), e.g. the FAQ database of an app."""
+    return get_registry().get(("vector_store", name), factory)
@@ -0,0 +1,355 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from langchain_groq import ChatGroq
+
+from llm_core.config import get_settings
+from llm_core.models import AUTO_MODEL_ID, MODELS, context_window
+from llm_core.prompt_budget import estimate_tokens
+
+# Number of recent requests kept to compute latency and error rates
+STATS_WINDOW = 50
+
+# Requests needed before a model's statistics are trusted
+MIN_SAMPLES = 5
+
+# A model whose recent error rate is above this value is considered unhealthy
+MAX_ERROR_RATE = 0.5
+
+# Seconds a model is skipped after a rate limit error without Retry-After
+RATE_LIMIT_COOLDOWN = 30.0
+
+# Tokens reserved for the response when the caller does not set max_tokens
+DEFAULT_RESPONSE_TOKENS = 1024
+
+
+class NoModelAvailableError(RuntimeError):
+    """Raised when no model can serve a request."""
+
+
+def status_code(error):
+    """Return the HTTP status code carried by an API error, if any."""
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code
+
+
+def is_retryable(error):
+    """Tell whether another model may succeed where this error occurred."""
+    code = status_code(error)
+    if code is not None:
+        return code in (408, 409, 429) or code >= 500
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+def retry_after(error):
+    """Return the Retry-After delay of a rate limit error, in seconds."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return RATE_LIMIT_COOLDOWN
+
+
+class CallGroup:
+    """
+    Run a callback once a hedged request and every call it started are done.
+
+    The request itself counts as one member, so the callback cannot run
+    before it has started all of its calls.
+    """
+
+    def __init__(self, on_done):
+        self._members = 1
+        self._on_done = on_done
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self._members += 1
+
+    def exit(self, *args):
+        with self._lock:
+            self._members -= 1
+            last = self._members == 0
+        if last:
+            self._on_done()
+
+
+class ModelStats:
+    """Rolling latency and error statistics of one model."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def record_error(self, error):
+        with self._lock:
+            self._samples.append(None)
+            if status_code(error) == 429:
+                self.cooldown_until = time.monotonic() + retry_after(error)
+
+    def _latencies(self):
+        with self._lock:
+            return sorted(sample for sample in self._samples if sample is not None)
+
+    def percentile(self, q):
+        """Latency percentile (0-100) of the successful requests, or None without enough samples."""
+        latencies = self._latencies()
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))]
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return 0.0
+            return sum(sample is None for sample in self._samples) / len(self._samples)
+
+    @property
+    def cooling_down(self):
+        """Tell whether the model is rate limited until its Retry-After delay has passed."""
+        return time.monotonic() < self.cooldown_until
+
+    @property
+    def healthy(self):
+        return not self.cooling_down and self.error_rate <= MAX_ERROR_RATE
+
+
+class ModelRouter:
+    """
+    Route requests to the fastest healthy model that fits them.
+
+    The router keeps rolling latency and error statistics per model. Requests
+    go to the healthy model with the lowest median latency (models without
+    enough samples are tried first, in preference order), fail over to the next model
+    on timeouts, rate limits and server errors, and skip rate limited models
+    until their Retry-After delay has passed, unless every other model failed.
+
+    With hedging enabled, a request still running after the p95 latency of its
+    model is duplicated to the next candidate and the first answer wins.
+    At most max_hedges requests are hedged at a time, counting the slower
+    calls still running after their request has returned; beyond that,
+    requests run in the caller's thread without a backup.
+
+    Parameters:
+    - model_ids (list of str): Candidate models, in order of preference.
+    - hedge (bool): Duplicate slow requests to a second model.
+    - max_hedges (int): Hedged requests in flight, the "io" pool size by default.
+    """
+
+    def __init__(self, model_ids, hedge=False, max_hedges=None):
+        self.model_ids = list(model_ids)
+        self.hedge = hedge
+        self.stats = {model_id: ModelStats() for model_id in self.model_ids}
+        max_hedges = max_hedges or get_settings().io_workers
+        self._hedge_slots = threading.BoundedSemaphore(max_hedges)
+        # Two calls per hedged request, so a call never waits for a thread
+        self._executor = ThreadPoolExecutor(max_workers=2 * max_hedges, thread_name_prefix="router")
+
+    def candidates(self, required_tokens=0):
+        """
+        Models able to serve a request of required_tokens, best first.
+
+        Healthy models come first: the ones without enough samples, in
+        preference order so they get measured, then the others by median
+        latency. Models with a high error rate follow, and rate limited
+        models come last, soonest available first, as a last resort.
+        """
+        fitting = [
+            model_id for model_id in self.model_ids
+            if context_window(model_id) >= required_tokens
+        ]
+
+        def rank(model_id):
+            stats = self.stats[model_id]
+            median = stats.percentile(50)
+            # sorted() is stable, so ties keep the preference order
+            return (not stats.healthy, median is not None, median or 0.0)
+
+        ready = [model_id for model_id in fitting if not self.stats[model_id].cooling_down]
+        cooling = [model_id for model_id in fitting if self.stats[model_id].cooling_down]
+        return sorted(ready, key=rank) + sorted(cooling, key=lambda model_id: self.stats[model_id].cooldown_until)
+
+    def _next_candidate(self, pending, allow_cooling=True):
+        """
+        Remove and return the first pending model not rate limited, as a model
+        may have become rate limited since the candidates were ranked.
+
+        Returns the first pending model if they all are and allow_cooling is
+        True, None otherwise.
+        """
+        for index, model_id in enumerate(pending):
+            if not self.stats[model_id].cooling_down:
+                return pending.pop(index)
+        return pending.pop(0) if pending and allow_cooling else None
+
+    def invoke(self, call, required_tokens=0):
+        """
+        Run call(model_id) on the best candidate, failing over on retryable errors.
+
+        Parameters:
+        - call (callable): Function sending the request to the given model.
+        - required_tokens (int): Prompt plus response tokens of the request.
+
+        Returns:
+        - The value returned by call for the model that answered.
+
+        Raises:
+        - NoModelAvailableError: If no model has a large enough context window.
+        - Exception: The last error when every candidate failed, or the first
+          non retryable error.
+        """
+        pending = self.candidates(required_tokens)
+        if not pending:
+            raise NoModelAvailableError(f"No model can fit a request of {required_tokens} tokens.")
+
+        last_error = None
+        while pending:
+            model_id = self._next_candidate(pending)
+            can_hedge = self.hedge and any(not self.stats[other].cooling_down for other in pending)
+            deadline = self.stats[model_id].percentile(95) if can_hedge else None
+            try:
+                if deadline is not None and self._hedge_slots.acquire(blocking=False):
+                    return self._hedged_call(call, model_id, pending, deadline)
+                return self._call(call, model_id)
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                last_error = error
+        raise last_error
+
+    def _call(self, call, model_id):
+        start = time.monotonic()
+        try:
+            result = call(model_id)
+        except Exception as error:
+            if is_retryable(error):
+                self.stats[model_id].record_error(error)
+            raise
+        self.stats[model_id].record_success(time.monotonic() - start)
+        return result
+
+    def _submit(self, group, call, model_id):
+        group.enter()
+        future = self._executor.submit(self._call, call, model_id)
+        future.add_done_callback(group.exit)
+        return future
+
+    def _hedged_call(self, call, model_id, pending, deadline):
+        # The hedging slot is released once the slower call is done too
+        group = CallGroup(self._hedge_slots.release)
+        try:
+            primary = self._submit(group, call, model_id)
+            done, _ = wait([primary], timeout=deadline)
+            if done:
+                return primary.result()
+
+            # Never hedged to a rate limited model, the primary call is the only one left then
+            backup_id = self._next_candidate(pending, allow_cooling=False)
+            if backup_id is None:
+                return primary.result()
+            backup = self._submit(group, call, backup_id)
+            futures = {primary, backup}
+            last_error = None
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # The slower request keeps running and only updates the statistics
+                        return future.result()
+                    last_error = future.exception()
+                    if not is_retryable(last_error):
+                        raise last_error
+            raise last_error
+        finally:
+            group.exit()
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model sending each request to the model chosen by a ModelRouter.
+
+    It can be used anywhere a ChatGroq instance is expected (chains,
+    llm.invoke, ...). Setting base_url points every model at another
+    OpenAI-compatible endpoint, such as llm_core.stub_server.
+    """
+
+    router: Any
+    api_key: str
+    base_url: Optional[str] = None
+    temperature: float = 0.0
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = 30.0
+    max_retries: int = 0
+
+    _llms: Dict[str, ChatGroq] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self):
+        return "routed-groq"
+
+    def _get_llm(self, model_id):
+        llm = self._llms.get(model_id)
+        if llm is None:
+            llm = ChatGroq(
+                model=model_id,
+                api_key=self.api_key,
+                base_url=self.base_url,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+            )
+            self._llms[model_id] = llm
+        return llm
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        response_tokens = kwargs.get("max_tokens") or self.max_tokens or DEFAULT_RESPONSE_TOKENS
+        required_tokens = prompt_tokens + response_tokens
+
+        def call(model_id):
+            return self._get_llm(model_id).invoke(messages, stop=stop, **kwargs)
+
+        message = self.router.invoke(call, required_tokens)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# Router shared by every session of the app process
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def default_router():
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = ModelRouter(MODELS.values(), hedge=True)
+        return _default_router
+
+
+def load_chat_model(model_id, api_key, temperature=0, **kwargs):
+    """
+    Initialize the chat model for a model ID chosen in the app.
+
+    Returns a ChatGroq instance for a concrete model ID, or a RoutedChatModel
+    using the shared router for AUTO_MODEL_ID.
+    """
+    if model_id == AUTO_MODEL_ID:
+        return RoutedChatModel(router=default_router(), api_key=api_key, temperature=temperature, **kwargs)
+    return ChatGroq(model=model_id, api_key=api_key, temperature=temperature, **kwargs)
@@ -0,0 +1,128 @@
+import codecs
+
+# Size of the raw byte blocks read from the uploaded file
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def iter_decoded_blocks(uploaded_file, encoding="utf-8", block_size=READ_BLOCK_SIZE):
+    """
+    Read an uploaded file block by block and decode it incrementally.
+
+    Multi-byte characters split across two blocks are handled by the incremental
+    decoder, so the whole file never has to be decoded in a single string.
+
+    Parameters:
+    - uploaded_file: Binary file-like object (e.g. a Streamlit UploadedFile).
+    - encoding (str): Text encoding of the file.
+    - block_size (int): Number of bytes read per block.
+
+    Yields:
+    - str: Decoded text blocks, in file order.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    uploaded_file.seek(0)
+    while True:
+        block = uploaded_file.read(block_size)
+        if not block:
+            break
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class WordLimitError(ValueError):
+    """Raised by WordCounter as soon as a text has more than its maximum number of words."""
+
+
+class WordCounter:
+    """
+    Count whitespace-separated words over a stream of text blocks.
+
+    A word cut in half by a block boundary is only counted once.
+
+    Parameters:
+    - max_words (int): Count above which WordLimitError is raised, no limit if None.
+    """
+
+    def __init__(self, max_words=None):
+        self.count = 0
+        self.max_words = max_words
+        self._inside_word = False
+
+    def update(self, text):
+        if not text:
+            return self.count
+        words = len(text.split())
+        if self._inside_word and not text[0].isspace():
+            words -= 1
+        self.count += words
+        self._inside_word = not text[-1].isspace()
+        if self.max_words is not None and self.count > self.max_words:
+            raise WordLimitError(f"The text has more than {self.max_words} words.")
+        return self.count
+
+    def track(self, blocks):
+        """
+        Pass text blocks through unchanged while counting their words.
+
+        Raises:
+        - WordLimitError: At the first block going over max_words, before it is passed on.
+        """
+        for block in blocks:
+            self.update(block)
+            yield block
+
+
+def iter_split_text(blocks, text_splitter, window_size=None, max_buffer=None):
+    """
+    Split a stream of text blocks into chunks without holding the whole text.
+
+    Blocks are buffered until the buffer reaches `window_size` characters, the
+    buffer is split with `text_splitter`, and every chunk but the last one is
+    yielded. The last chunk is carried over to the next window so chunks never
+    end at an arbitrary block boundary. A text without the splitter's
+    separators is cut every `max_buffer` characters, so peak memory and the
+    work of re-splitting the buffer stay bounded whatever the input.
+
+    Parameters:
+    - blocks (iterable of str): Decoded text blocks, e.g. from iter_decoded_blocks.
+    - text_splitter: A LangChain text splitter exposing split_text().
+    - window_size (int): Characters buffered before splitting. Defaults to
+      eight times the splitter's chunk size.
+    - max_buffer (int): Characters buffered before chunks are forced out.
+      Defaults to four times the window size.
+
+    Yields:
+    - str: Text chunks, in document order.
+    """
+    chunk_size = text_splitter._chunk_size
+    if window_size is None:
+        window_size = 8 * chunk_size
+    if max_buffer is None:
+        max_buffer = 4 * window_size
+
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        if len(buffer) < window_size:
+            continue
+        chunks = text_splitter.split_text(buffer)
+        if len(chunks) < 2:
+            if len(buffer) < max_buffer:
+                # No separator found yet, keep reading
+                continue
+            # Still no separator, cut the buffer into chunks of the maximum size
+            for start in range(0, len(buffer), chunk_size):
+                yield buffer[start:start + chunk_size]
+            buffer = ""
+            continue
+        yield from chunks[:-1]
+        # Carry the raw tail over so whitespace stripped by the splitter is kept
+        start = buffer.rfind(chunks[-1])
+        buffer = buffer[start:] if start >= 0 else chunks[-1]
+
+    if buffer:
+        yield from text_splitter.split_text(buffer)
@@ -0,0 +1,238 @@
+"""
+Local stand-in for the Groq OpenAI-compatible chat completions API.
+
+Serves POST /openai/v1/chat/completions (the path used by the Groq client) and
+/v1/chat/completions with canned text, simulating time to first token, token
+throughput and rate limiting, so the apps and the model router can be
+exercised without spending Groq quota:
+
+    python -m llm_core.stub_server --port 8099 --latency 0.3 --rate-limit-ratio 0.1
+
+and point ChatGroq or RoutedChatModel at it with base_url="http://127.0.0.1:8099",
+or start an app with GROQ_BASE_URL=http://127.0.0.1:8099 in its environment.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words used to build the generated completions
+LOREM = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua"
+).split()
+
+# Tokens generated when the request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 64
+
+
+class StubConfig:
+    """
+    Behaviour of the stub server.
+
+    Parameters:
+    - latency (float): Seconds before the first token, per model if model_latency overrides it.
+    - jitter (float): Relative spread of the latency, e.g. 0.5 for +/- 50%.
+    - tokens_per_second (float): Output throughput once generation has started.
+    - rate_limit_ratio (float): Probability of answering a request with a 429.
+    - retry_after (float): Retry-After header sent with the 429 responses.
+    - model_latency (dict): Latency overrides by model ID.
+    """
+
+    def __init__(self, latency=0.2, tokens_per_second=500.0, rate_limit_ratio=0.0,
+                 retry_after=1.0, model_latency=None, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.model_latency = dict(model_latency or {})
+
+
+def count_tokens(text):
+    # Close enough to the real tokenizers for sizing prompts
+    return max(1, len(text) // 4)
+
+
+def completion_words(n_tokens):
+    return [LOREM[i % len(LOREM)] for i in range(n_tokens)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "GroqStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            models = sorted(set(self.server.config.model_latency) | {"llama3-8b-8192"})
+            self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in models]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+        self.server.count_request()
+
+        if random.random() < config.rate_limit_ratio:
+            self.server.count_rate_limited()
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": str(config.retry_after)},
+            )
+            return
+
+        model = request.get("model", "llama3-8b-8192")
+        prompt = " ".join(str(message.get("content", "")) for message in request.get("messages", []))
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+        words = completion_words(completion_tokens)
+
+        latency = config.model_latency.get(model, config.latency)
+        time.sleep(latency * random.uniform(1 - config.jitter, 1 + config.jitter))
+        if request.get("stream"):
+            self._stream(model, words, prompt_tokens)
+        else:
+            time.sleep(completion_tokens / config.tokens_per_second)
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "length",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+    def _stream(self, model, words, prompt_tokens):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for index, word in enumerate(words):
+            time.sleep(1 / self.server.config.tokens_per_second)
+            finish_reason = "length" if index == len(words) - 1 else None
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": finish_reason}],
+            }
+            if finish_reason:
+                chunk["x_groq"] = {"usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(words),
+                    "total_tokens": prompt_tokens + len(words),
+                }}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering like the Groq chat completions API."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        super().__init__((host, port), StubHandler)
+        self.config = config or StubConfig()
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_rate_limited(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    def start(self):
+        """Serve in a background thread and return the server."""
+        self._thread = threading.Thread(target=self.serve_forever, name="groq-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Relative spread of the latency.")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of requests answered with 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument(
+        "--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+        help="Latency override for one model, can be repeated."
+    )
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        model_latency={
+            model: float(seconds)
+            for model, seconds in (override.split("=", 1) for override in args.model_latency)
+        },
+    )
+    server = StubServer(args.host, args.port, config)
+    print(f"Groq stub listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Resumable map-reduce summarization with a persistent cache of map results.
+
+Every chunk summary is stored on disk as soon as it is generated, keyed by
+(model ID, prompt version, chunk hash). Running the same summarization again,
+after a timeout, a 429 or a browser reconnect, only calls the model for the
+chunks that are still missing.
+
+Chunks are cut at paragraph boundaries chosen from the paragraph contents
+rather than from character offsets, so editing one paragraph of a long
+document changes the chunk that contains it and leaves the others, and their
+cached summaries, untouched.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from llm_core.config import get_settings
+from llm_core.executor import map_jobs
+from llm_core.prompt_budget import estimate_tokens
+
+# Same prompt as LangChain's map_reduce summarize chain, for the map and reduce steps
+SUMMARY_TEMPLATE = """Write a concise summary of the following:
+
+
+"{text}"
+
+
+CONCISE SUMMARY:"""
+
+# Summaries are combined in groups of at most this many tokens, as token_max in LangChain
+DEFAULT_TOKEN_MAX = 3000
+
+# Collapse rounds before giving up, as collapse_max_retries in LangChain
+DEFAULT_COLLAPSE_MAX_ROUNDS = 4
+
+# One chunk boundary every CUT_PERIOD paragraphs on average, once the minimum size is reached
+CUT_PERIOD = 4
+
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+# Characters of a paragraph without blank line after which it is yielded anyway
+MAX_PARAGRAPH_SIZE = 256 * 1024
+
+
+def prompt_version(template):
+    """Short hash of a prompt template, so editing the prompt invalidates its cached results."""
+    return hashlib.sha256(template.encode()).hexdigest()[:12]
+
+
+class SummaryCache:
+    """
+    SQLite store of generated summaries, safe to share between threads and sessions.
+
+    Parameters:
+    - path (str or Path): Database file, created if missing.
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, model_id TEXT, prompt_version TEXT, "
+                "summary TEXT, created REAL)"
+            )
+
+    @staticmethod
+    def key(model_id, version, text):
+        digest = hashlib.sha256()
+        for part in (model_id, version, text):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """Return the cached summaries among keys, as a dict key -> summary."""
+        found = {}
+        keys = list(keys)
+        # Stay well under SQLite's limit on the number of query parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT key, summary FROM summaries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+            found.update(rows)
+        return found
+
+    def put(self, key, model_id, version, summary):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                (key, model_id, version, summary, time.time())
+            )
+
+
+@lru_cache(maxsize=None)
+def default_cache():
+    """Cache shared by every app and session of the process."""
+    return SummaryCache(get_settings().cache_dir / "summaries.sqlite3")
+
+
+def iter_paragraphs(blocks, max_size=MAX_PARAGRAPH_SIZE):
+    """
+    Yield the non-empty paragraphs of a stream of text blocks.
+
+    Paragraphs are separated by blank lines; a paragraph cut by a block
+    boundary is yielded once it is complete. A text without blank lines is
+    yielded every max_size characters, so the buffer is never re-scanned
+    more than a few times.
+    """
+    buffer = ""
+    for block in blocks:
+        buffer += block.replace("\r\n", "\n")
+        parts = PARAGRAPH_BREAK.split(buffer)
+        buffer = parts.pop()
+        if len(buffer) >= max_size:
+            parts.append(buffer)
+            buffer = ""
+        for paragraph in parts:
+            if paragraph.strip():
+                yield paragraph.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _split_long_paragraph(paragraph, max_size):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        separators=["\n", ". ", " "],
+        chunk_size=max_size,
+        chunk_overlap=0
+    )
+    # Pieces without any separator are sliced, splitting them character by character is quadratic
+    return [
+        piece[start:start + max_size]
+        for piece in text_splitter.split_text(paragraph)
+        for start in range(0, len(piece), max_size)
+    ]
+
+
+def content_defined_chunks(paragraphs, chunk_size=5000):
+    """
+    Group paragraphs into chunks whose boundaries depend on the content only.
+
+    A chunk is closed after a paragraph whose hash is a multiple of CUT_PERIOD
+    once it holds at least half of chunk_size characters, or before it would
+    exceed chunk_size. An edit therefore only moves the boundaries of the
+    chunk it falls in, and the chunking resynchronizes at the next
+    content-defined boundary. Paragraphs longer than chunk_size are split on
+    lines, then sentences.
+
+    Parameters:
+    - paragraphs (iterable of str): Paragraphs in document order, e.g. from iter_paragraphs.
+    - chunk_size (int): Maximum number of characters in a chunk.
+
+    Yields:
+    - str: Chunks, paragraphs joined by blank lines.
+    """
+    min_size = chunk_size // 2
+    current = []
+    size = 0
+    for paragraph in paragraphs:
+        pieces = [paragraph] if len(paragraph) <= chunk_size else _split_long_paragraph(paragraph, chunk_size)
+        for piece in pieces:
+            if current and size + len(piece) + 2 > chunk_size:
+                yield "\n\n".join(current)
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+            if size >= min_size and zlib.crc32(piece.encode()) % CUT_PERIOD == 0:
+                yield "\n\n".join(current)
+                current, size = [], 0
+    if current:
+        yield "\n\n".join(current)
+
+
+@dataclass
+class SummaryResult:
+    text: str
+    chunks: int
+    reused: int
+    generated: int
+
+
+class CollapseLimitError(ValueError):
+    """Raised when the summaries still do not fit in one reduce call after collapse_max_rounds rounds."""
+
+
+class ResumableSummarizer:
+    """
+    Map-reduce summarizer that persists every model answer before moving on.
+
+    The map step summarizes each chunk, the reduce step combines the
+    summaries in groups of at most token_max tokens until a single group is
+    left, and summarizes it. Both steps go through the cache, so a rerun on
+    an unchanged document makes no model call, and a rerun after an edit
+    only summarizes the changed chunks and redoes the reduce.
+
+    Parameters:
+    - llm: LangChain chat model, e.g. from llm_core.router.load_chat_model.
+    - model_id (str): ID the model was loaded with, part of the cache key.
+    - cache (SummaryCache): Store of the summaries, the shared default_cache() if None.
+    - template (str): Prompt with a {text} variable, used for both steps.
+    - max_workers (int): Chunks summarized concurrently, at most the session's share of the
+      "io" pool; each chunk summary is a job of that pool.
+    - token_max (int): Maximum size of a group of summaries combined in one call.
+    - collapse_max_rounds (int): Maximum number of collapse rounds of the reduce step.
+    """
+
+    def __init__(self, llm, model_id, cache=None, template=SUMMARY_TEMPLATE,
+                 max_workers=None, token_max=DEFAULT_TOKEN_MAX, collapse_max_rounds=DEFAULT_COLLAPSE_MAX_ROUNDS):
+        self.llm = llm
+        self.model_id = model_id
+        self.cache = cache or default_cache()
+        self.template = template
+        self.version = prompt_version(template)
+        self.max_workers = max_workers
+        self.token_max = token_max
+        self.collapse_max_rounds = collapse_max_rounds
+        self.reused = 0
+        self.generated = 0
+
+    def _summarize_text(self, text):
+        response = self.llm.invoke(self.template.format(text=text))
+        return response.content.strip()
+
+    def summarize_all(self, texts, on_progress=None):
+        """
+        Summarize each text, reusing cached summaries and storing new ones as they arrive.
+
+        Parameters:
+        - texts (list of str): Texts to summarize.
+        - on_progress (callable): Called with (done, total) after each summary.
+
+        Returns:
+        - list of str: The summaries, in the order of texts.
+
+        Raises:
+        - Exception: The first model error, once the calls already started have
+          finished and their results are stored.
+        """
+        keys = [self.cache.key(self.model_id, self.version, text) for text in texts]
+        summaries = self.cache.get_many(set(keys))
+        missing = {key: text for key, text in zip(keys, texts) if key not in summaries}
+        self.reused += len(set(keys)) - len(missing)
+
+        done = len(texts) - sum(1 for key in keys if key in missing)
+        if on_progress:
+            on_progress(done, len(texts))
+
+        error = None
+        missing_keys = list(missing)
+        # Each call is a job of the shared "io" pool, pending ones are cancelled with the session
+        for index, future in map_jobs("io", self._summarize_text, list(missing.values()), limit=self.max_workers):
+            key = missing_keys[index]
+            try:
+                summary = future.result()
+            except Exception as exc:
+                # Let the other calls finish so their results are kept
+                error = error or exc
+                continue
+            self.cache.put(key, self.model_id, self.version, summary)
+            summaries[key] = summary
+            self.generated += 1
+            done += keys.count(key)
+            if on_progress:
+                on_progress(done, len(texts))
+        if error:
+            raise error
+        return [summaries[key] for key in keys]
+
+    def _group(self, summaries):
+        groups, current, size = [], [], 0
+        for summary in summaries:
+            tokens = estimate_tokens(summary)
+            if current and size + tokens > self.token_max:
+                groups.append(current)
+                current, size = [], 0
+            current.append(summary)
+            size += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def summarize(self, chunks, on_progress=None):
+        """
+        Summarize a document given as chunks.
+
+        Parameters:
+        - chunks (list of str): Document chunks, e.g. from content_defined_chunks.
+        - on_progress (callable): Called with (done, total) during the map step.
+
+        Returns:
+        - SummaryResult: The summary and how many summaries were reused or generated.
+
+        Raises:
+        - CollapseLimitError: If the summaries do not fit in a single reduce call after
+          collapse_max_rounds collapse rounds, e.g. when the model answers get no shorter.
+        """
+        self.reused = self.generated = 0
+        summaries = self.summarize_all(chunks, on_progress)
+
+        # Collapse the summaries until they fit in a single reduce call
+        groups = self._group(summaries)
+        rounds = 0
+        while len(groups) > 1:
+            if rounds == self.collapse_max_rounds:
+                raise CollapseLimitError(
+                    f"The summaries still form {len(groups)} groups of at most {self.token_max} tokens "
+                    f"after {rounds} collapse rounds."
+                )
+            summaries = self.summarize_all(["\n".join(group) for group in groups])
+            groups = self._group(summaries)
+            rounds += 1
+
+        text = self.summarize_all(["\n".join(groups[0])])[0] if groups else ""
+        return SummaryResult(text=text, chunks=len(chunks), reused=self.reused, generated=self.generated)
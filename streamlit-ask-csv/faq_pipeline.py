@@ -0,0 +1,121 @@
+# Retrieval QA over the FAQ CSV, without Streamlit so it can be load tested.
+# Heavy dependencies are imported where they are used, so the page renders first.
+
+# Template of the answer, based on the retrieved FAQ entries only
+template = """
+Given the following context and a question, generate an answer based on this context only.
+In the answer, try to provide as much text as possible from the "response" section in the source document context without making many changes.
+If the answer is not found in the context, respond "I don't know." Don't try to make up an answer.
+
+CONTEXT: {context}
+
+QUESTION: {question}
+"""
+
+
+def db_exists(vectordb_file_path):
+    """Tell whether a vector database was saved in the folder."""
+    from llm_core.folders import current_version
+
+    return current_version(vectordb_file_path) is not None
+
+
+def create_db(csv_path, embedding, vectordb_file_path, compressed=False, if_missing=False):
+    """
+    Embed every row of the FAQ CSV and save the vector database.
+
+    The database is published as a new version of the folder (see
+    llm_core.folders), so the sessions loading it never see a missing or
+    half-written one, and the threads creating it take turns.
+
+    Parameters:
+    - csv_path (str): CSV file with "prompt" and "response" columns.
+    - embedding (Embeddings): Model embedding the rows.
+    - vectordb_file_path (str): Folder the database is saved to.
+    - compressed (bool): Build the compressed database (int8 vectors, compressed text).
+    - if_missing (bool): Only create the database if the folder has none, e.g.
+      when another session created it while this one was waiting.
+
+    Returns:
+    - bool: True if the database was created, False if it already existed.
+    """
+    from llm_core.folders import current_version, folder_lock
+
+    with folder_lock(vectordb_file_path):
+        if if_missing and current_version(vectordb_file_path) is not None:
+            return False
+
+        from langchain.document_loaders.csv_loader import CSVLoader
+
+        loader = CSVLoader(file_path=csv_path, source_column="prompt")
+        documents = loader.load()
+        if compressed:
+            from llm_core.quantized_store import QuantizedFAISS
+
+            QuantizedFAISS.from_documents(documents, embedding, folder_path=vectordb_file_path, index_factory="SQ8")
+        else:
+            import shutil
+            from langchain_community.vectorstores import FAISS
+            from llm_core.folders import new_version, publish_folder
+
+            vectordb = FAISS.from_documents(documents, embedding)
+            build_path = new_version(vectordb_file_path)
+            try:
+                vectordb.save_local(str(build_path))
+            except BaseException:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise
+            publish_folder(build_path, vectordb_file_path)
+    return True
+
+
+def load_db(vectordb_file_path, embedding, compressed=False):
+    """Open the current version of a vector database saved by create_db()."""
+    if compressed:
+        from llm_core.quantized_store import QuantizedFAISS
+
+        return QuantizedFAISS.load_local(vectordb_file_path, embedding)
+
+    from langchain_community.vectorstores import FAISS
+    from llm_core.folders import current_version
+
+    folder = current_version(vectordb_file_path)
+    if folder is None:
+        raise FileNotFoundError(f"No vector database in {vectordb_file_path}.")
+    return FAISS.load_local(str(folder), embedding, allow_dangerous_deserialization=True)
+
+
+def build_chain(vectordb, llm, reranker=None):
+    """
+    Create the retrieval QA chain answering from the vector database.
+
+    Parameters:
+    - vectordb (VectorStore): The FAQ vector database.
+    - llm: Chat model writing the answer.
+    - reranker (CrossEncoderReranker): Reranker of the retrieved entries, None to keep the vector order.
+
+    Returns:
+    - RetrievalQA: Chain taking {"query": question} and returning the answer in "result".
+    """
+    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
+    from llm_core.rerank import DEFAULT_FETCH_K, PostRetrievalRetriever
+
+    # Fetch extra candidates, drop duplicate entries, rerank them and keep the best ones
+    retriever = PostRetrievalRetriever(
+        base_retriever=vectordb.as_retriever(search_kwargs={"k": DEFAULT_FETCH_K}),
+        reranker=reranker,
+        max_tokens=1500,
+        max_documents=4
+    )
+
+    prompt = PromptTemplate(template=template, input_variables=["context", "question"])
+
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever,
+        input_key="query",
+        return_source_documents=True,
+        chain_type_kwargs={"prompt": prompt}
+    )
@@ -1,19 +1,37 @@
-import streamlit as st
-from langchain_community.vectorstores import FAISS
-from langchain_groq import ChatGroq
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain.document_loaders.csv_loader import CSVLoader
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import streamlit as st
+import faq_pipeline
+from llm_core import resources
+from llm_core.executor import run_job
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
+
+# Heavy dependencies are imported where they are used, so the page renders first.
+# The LLM client, embedding model, reranker and vector database are shared by
+# all sessions and apps of the process through the llm_core resource registry.
 def load_llm(api_key, model_name):
-    return ChatGroq(model=model_name, temperature=0, api_key=api_key)
+    return resources.chat_model(model_name, api_key, temperature=0)
 
 # Page title and header
 st.set_page_config(page_title="Napoleon FAQ Bot")
 st.title("🤖 Napoleon FAQ Bot")
 st.markdown("Ask anything about Napoleon from our CSV database!")
 
+# Warm up the heavy imports while the user enters the API key
+preload(
+    "langchain_huggingface.embeddings",
+    "langchain_community.vectorstores",
+    "langchain.chains",
+    "llm_core.rerank",
+    "sentence_transformers",
+    "llm_core.router"
+)
+
 # Function to get Groq API key from user
 def get_groq_api_key():
     return st.text_input("🔑 Enter Your Groq API Key", type="password")
@@ -22,81 +40,65 @@ def get_groq_api_key():
 groq_api_key = get_groq_api_key()
 
 # Model options
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
+models = MODEL_OPTIONS
 
 # Select LLM model
 selected_model = st.selectbox("Choose an LLM model:", list(models.keys()))
 
+# Storage of the vector database
+compressed_db = st.checkbox(
+    "🗜️ Use the compressed vector database",
+    help="Stores int8 vectors and compressed FAQ entries read on demand, for large CSV files."
+)
+
 # Only proceed if the API key is provided
 if groq_api_key and selected_model:
-    vectordb_file_path = "vector_db"
-
-    # Initialize embeddings
-    embedding = HuggingFaceEmbeddings()
-
-    # Function to create the vector database
-    def create_db():
-        st.info("Creating vector database from CSV...")
-        loader = CSVLoader(file_path='napoleon-faqs.csv', source_column="prompt")
-        documents = loader.load()
-        vectordb = FAISS.from_documents(documents, embedding)
-        vectordb.save_local(vectordb_file_path)
-        st.success("Database created successfully!")
-
-    # Function to execute the retrieval QA chain
-    def execute_chain():
-        vectordb = FAISS.load_local(vectordb_file_path, embedding, allow_dangerous_deserialization=True)
-        retriever = vectordb.as_retriever(score_threshold=0.7)
-
-        template = """
-        Given the following context and a question, generate an answer based on this context only.
-        In the answer, try to provide as much text as possible from the "response" section in the source document context without making many changes.
-        If the answer is not found in the context, respond "I don't know." Don't try to make up an answer.
-
-        CONTEXT: {context}
-
-        QUESTION: {question}
-        """
-
-        prompt = PromptTemplate(template=template, input_variables=["context", "question"])
-        llm = load_llm(api_key=groq_api_key, model_name=models[selected_model])
-
-        chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            input_key="query",
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": prompt}
-        )
-
-        return chain
-
-    # Create the database initially
-    create_db()
-    chain = execute_chain()
-
-    # Button to recreate the database
-    if st.button("🔄 Recreate Database"):
-        create_db()
+    # The shared models and database are leased, so they are not evicted while the jobs use them
+    with resources.leases():
+        vectordb_file_path = "vector_db_sq8" if compressed_db else "vector_db"
+
+        # Initialize embeddings
+        embedding = resources.embeddings()
+
+        # Function to create the vector database, unless another session did while this one waited
+        def create_db(if_missing=False):
+            st.info("Creating vector database from CSV...")
+            if faq_pipeline.create_db(
+                'napoleon-faqs.csv', embedding, vectordb_file_path, compressed=compressed_db, if_missing=if_missing
+            ):
+                # The sessions reload the rebuilt database on their next question
+                resources.get_registry().evict(("vector_store", vectordb_file_path))
+            st.success("Database created successfully!")
+
+        # Function to execute the retrieval QA chain
+        def execute_chain():
+            vectordb = resources.vector_store(
+                vectordb_file_path,
+                lambda: faq_pipeline.load_db(vectordb_file_path, embedding, compressed=compressed_db)
+            )
+            llm = load_llm(api_key=groq_api_key, model_name=models[selected_model])
+            return faq_pipeline.build_chain(vectordb, llm, reranker=resources.reranker())
+
+        # Create the database if it does not exist yet, embedding runs in the shared CPU pool
+        if not faq_pipeline.db_exists(vectordb_file_path):
+            run_job("cpu", create_db, if_missing=True, label="Creating vector database...")
+
+        # Button to recreate the database
+        if st.button("🔄 Recreate Database"):
+            run_job("cpu", create_db, label="Creating vector database...")
+
         chain = execute_chain()
 
-    # Input for the user's question
-    question = st.text_input("💬 Ask your question about Napoleon:")
+        # Input for the user's question
+        question = st.text_input("💬 Ask your question about Napoleon:")
 
-    # If a question is provided, get the answer from the chain
-    if question:
-        with st.spinner("🤔 Thinking..."):
-            response = chain({"query": question})
+        # If a question is provided, get the answer from the chain
+        if question:
+            # The model call runs in the shared I/O pool
+            response = run_job("io", chain.invoke, {"query": question}, label="🤔 Thinking...")
             answer = response["result"]
 
-        st.header("📝 Answer")
-        st.write(answer)
+            st.header("📝 Answer")
+            st.write(answer)
 else:
     st.warning("Please enter your Groq API Key to proceed and select a model.")
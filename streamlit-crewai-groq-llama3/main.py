@@ -1,37 +1,51 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
 import requests
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-from crewai import Agent, Task, Crew
-from langchain.tools import tool
-from langchain_groq import ChatGroq
-from langchain.utilities.tavily_search import TavilySearchAPIWrapper
-from langchain_community.tools.tavily_search import TavilySearchResults
+from llm_core import resources
+from llm_core.executor import run_job
+from llm_core.models import MODELS, context_window
+from llm_core.preload import preload
 
 load_dotenv()
 
 # Model options
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
-
-# Initialize LLM with Groq model
+models = MODELS
+
+# Heavy dependencies (crewai, bs4, langchain) are imported where they are used,
+# so the page renders before they are loaded
+
+# Initialize LLM with Groq model, shared by the sessions using the same key
 def initialize_llm(api_key, model_id):
-    llm = ChatGroq(temperature=0, api_key=api_key, model=model_id)
+    llm = resources.chat_model(model_id, api_key, temperature=0)
     return llm
 
-@tool("process_search_tool", return_direct=False)
-def process_search_tool(url: str) -> str:
-    """Used to process content found on the internet."""
-    response = requests.get(url=url)
-    soup = BeautifulSoup(response.content, "html.parser")
-    return soup.get_text()
+# Initialize the search and page processing tools shared by the agents
+def initialize_tools(tavily_api_key):
+    from bs4 import BeautifulSoup
+    from langchain.tools import tool
+    from langchain.utilities.tavily_search import TavilySearchAPIWrapper
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    @tool("process_search_tool", return_direct=False)
+    def process_search_tool(url: str) -> str:
+        """Used to process content found on the internet."""
+        response = requests.get(url=url, timeout=15)
+        soup = BeautifulSoup(response.content, "html.parser")
+        return soup.get_text()
+
+    search = TavilySearchAPIWrapper(tavily_api_key=tavily_api_key)
+    return [TavilySearchResults(api_wrapper=search), process_search_tool]
+
+# Initialize the agents, each calling the LLM and the tools through the run controller
+def initialize_agents(topic, llm, tools, controller):
+    from crewai import Agent
 
-def initialize_agents(topic, llm, tools):
     # Define roles with specific backstories
     roles = {
         "Online Researcher": {
@@ -61,8 +75,8 @@ def initialize_agents(topic, llm, tools):
             backstory=details["backstory"],
             verbose=True,
             allow_delegation=True,
-            tools=tools,
-            llm=llm
+            tools=controller.wrap_tools(tools),
+            llm=controller.wrap_llm(llm, role)
         )
         agents.append(agent)
 
@@ -75,6 +89,14 @@ def main():
 
     st.title("Content Generation App :rocket:")
 
+    # Warm up the heavy imports while the user fills in the form
+    preload(
+        "crewai",
+        "bs4",
+        "llm_core.router",
+        "langchain_community.tools.tavily_search"
+    )
+
     st.markdown("""
         Welcome to the Content Generation App! :book:
         
@@ -88,6 +110,16 @@ def main():
     
     topic = st.text_input("Enter a topic:", "Technology")
 
+    # Imported once the page has started rendering, it loads langchain_core
+    from llm_core.crew_control import BudgetExceededError, RunBudget, RunController
+
+    # Limits of a run, so that delegation loops cannot go on indefinitely
+    with st.expander("⚙️ Run limits"):
+        default_budget = RunBudget()
+        max_llm_calls = st.number_input("Maximum LLM calls", min_value=1, value=default_budget.max_llm_calls)
+        max_tokens = st.number_input("Maximum tokens", min_value=1000, value=default_budget.max_tokens, step=10000)
+        deadline = st.number_input("Time limit (seconds)", min_value=10, value=int(default_budget.deadline), step=30)
+
     with st.form("myform", clear_on_submit=True):
         groq_api_key = st.text_input(
             "🔑 Groq API Key:",
@@ -102,12 +134,19 @@ def main():
         )
         if submitted and groq_api_key and tavily_api_key and topic:
             with st.spinner("Processing... :hourglass_flowing_sand:"):
+                from crewai import Crew, Task
+
                 # Initialize LLM with selected model 
                 llm = initialize_llm(groq_api_key, models[selected_model])
-                search = TavilySearchAPIWrapper(tavily_api_key=tavily_api_key)
-                tools = [TavilySearchResults(api_wrapper=search), process_search_tool]
+                tools = initialize_tools(tavily_api_key)
+
+                # Budgets, shared tool results and usage of this run
+                controller = RunController(
+                    RunBudget(max_llm_calls=max_llm_calls, max_tokens=max_tokens, deadline=deadline),
+                    context_window=context_window(models[selected_model])
+                )
 
-                agents = initialize_agents(topic, llm, tools)
+                agents = initialize_agents(topic, llm, tools, controller)
 
                 # Define tasks
                 task1 = Task(
@@ -140,16 +179,27 @@ def main():
                     verbose=2
                 )
 
-                # Update agents with initialized llm
-                for agent in agents:
-                    agent.llm = llm
-
-                result = crew.kickoff()
-                st.success("Process completed! :white_check_mark:")
+                # The agents' model and search calls run in the shared I/O pool
+                try:
+                    result = run_job("io", controller.run, crew.kickoff, label="Agents at work...")
+                except BudgetExceededError as e:
+                    st.warning(f"⚠️ {e} Here is what the agents completed:")
+                    for task in [task1, task2, task3, task4]:
+                        if task.output:
+                            st.info(task.output.raw_output)
+                    result = ""
+                else:
+                    st.success("Process completed! :white_check_mark:")
 
                 if len(result):
                     st.write("Here is my response:")
                     st.info(result)
 
+                st.caption(
+                    f"{controller.calls} LLM calls, {controller.tokens} tokens in {controller.elapsed:.0f}s; "
+                    f"{controller.tools.hits} tool calls answered from the shared results."
+                )
+                st.dataframe(controller.report(), hide_index=True)
+
 if __name__ == "__main__":
     main()
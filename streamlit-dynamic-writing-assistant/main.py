@@ -1,6 +1,31 @@
+import sys
+import time
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+from llm_core import resources
+from llm_core.executor import SERVICE_BUSY_MESSAGE, ServiceBusyError
+from llm_core.models import MODELS
+from llm_core.preload import preload
+from llm_core.prompt_budget import PromptBudget, PromptTooLongError, count_tokens, get_encoding
+from prefetch import DIALECTS, TONES, RewriteCache, RewritePrefetcher
+
+# Model used for the final rewrite and the fast model used for draft previews
+REWRITE_MODEL = MODELS["LLaMA3 70b"]
+FAST_DRAFT_MODEL = MODELS["LLaMA3 8b"]
+
+# Maximum number of tokens generated for a rewrite
+MAX_REWRITE_TOKENS = 2048
+
+# Longest draft whose rewrite fits in MAX_REWRITE_TOKENS, with room for an introduction.
+# Drafts this short always leave room for the full template's examples.
+MAX_DRAFT_TOKENS = int(MAX_REWRITE_TOKENS * 0.75)
+
+# Interval between refreshes of a rewrite that is still streaming
+REFRESH_INTERVAL = 0.1
 
 # Define the template for the redaction task
 template = """
@@ -43,21 +68,43 @@ DIALECT: {dialect}
 ### Your {dialect} Revision:
 """
 
-# Initialize PromptTemplate with input variables
-prompt = PromptTemplate(
-    input_variables=["tone", "dialect", "draft"],
-    template=template,
-)
+# Token budget of the template, built on first use so LangChain is not imported before the page renders
+@st.cache_resource
+def get_prompt_budget():
+    from langchain.prompts import PromptTemplate
 
-# Function to load the language model (LLM)
-def load_LLM(api_key):
-    llm = ChatGroq(model="llama3-70b-8192", temperature=0.7, api_key=api_key)
-    return llm
+    # Initialize PromptTemplate with input variables
+    prompt = PromptTemplate(
+        input_variables=["tone", "dialect", "draft"],
+        template=template,
+    )
+    return PromptBudget(prompt, input_variable="draft")
+
+# Function to load the language model (LLM), shared by the sessions using the same key
+def load_LLM(api_key, model_id=REWRITE_MODEL):
+    return resources.chat_model(model_id, api_key, temperature=0.7, max_tokens=MAX_REWRITE_TOKENS)
+
+# Rewrites run as jobs of the shared I/O pool, on behalf of the session
+@st.cache_resource
+def get_prefetcher():
+    return RewritePrefetcher()
+
+# Function to get the rewrites cached for the current draft in this session,
+# cancelling the ones still running for a previous draft
+def get_rewrite_cache(draft, prefetcher):
+    if st.session_state.get("rewrite_draft") != draft:
+        prefetcher.cancel(st.session_state.get("rewrite_cache", RewriteCache()))
+        st.session_state["rewrite_draft"] = draft
+        st.session_state["rewrite_cache"] = RewriteCache()
+    return st.session_state["rewrite_cache"]
 
 # Streamlit page configuration and title/header
 st.set_page_config(page_title="Text Redaction Tool")
 st.header("Text Redaction Tool")
 
+# Warm up the Groq client and the tokenizer while the user types the draft
+preload("llm_core.router", "langchain.prompts", get_encoding)
+
 # Introduction and credits
 col1, col2 = st.columns([2, 1])
 with col1:
@@ -73,23 +120,34 @@ groq_api_key = st.text_input(label="Groq API Key", placeholder="Ex: gsk_2twmA8tf
 st.markdown("## Enter the text you want to re-write")
 draft_input = st.text_area(label="Text", placeholder="Your Text...")
 
-# Check length of draft text
-if len(draft_input.split(" ")) > 700:
-    st.warning("Please enter a shorter text. The maximum length is 700 words.")
-    st.stop()
-
 # Tone and dialect selection
 col1, col2 = st.columns(2)
 with col1:
     option_tone = st.selectbox(
         'Which tone would you like your redaction to have?',
-        ('Formal', 'Informal')
+        TONES
     )
 
 with col2:
     option_dialect = st.selectbox(
         'Which English Dialect would you like?',
-        ('American', 'British')
+        DIALECTS
+    )
+
+# Generation options
+col1, col2 = st.columns(2)
+with col1:
+    precompute = st.toggle(
+        "Precompute all tones and dialects",
+        value=True,
+        help="Generate every combination in the background so switching is instant."
+    )
+
+with col2:
+    fast_draft = st.toggle(
+        "Show a fast draft",
+        value=False,
+        help=f"Display a {FAST_DRAFT_MODEL} draft while the {REWRITE_MODEL} rewrite is generated."
     )
 
 # Output the rewritten text
@@ -102,15 +160,63 @@ if draft_input:
             icon="⚠️")
         st.stop()
 
-    llm = load_LLM(api_key=groq_api_key)
+    # Check the rewrite of the draft fits in the output budget
+    draft_tokens = count_tokens(draft_input)
+    if draft_tokens > MAX_DRAFT_TOKENS:
+        st.warning(
+            f"Please enter a shorter text. The draft has {draft_tokens} tokens "
+            f"but at most {MAX_DRAFT_TOKENS} can be rewritten at once."
+        )
+        st.stop()
 
-    prompt_with_draft = prompt.format(
-        tone=option_tone,
-        dialect=option_dialect,
-        draft=draft_input
-    )
+    # Check the prompt and the rewrite fit in the context window
+    try:
+        draft_prompt, _ = get_prompt_budget().fit(
+            REWRITE_MODEL, draft_input, MAX_REWRITE_TOKENS,
+            tone=max(TONES, key=len), dialect=max(DIALECTS, key=len)
+        )
+    except PromptTooLongError as e:
+        st.warning(f"Please enter a shorter text. {e}")
+        st.stop()
 
-    with st.spinner("Generating..."):
-        improved_redaction = llm.invoke(prompt_with_draft)
+    llm = load_LLM(api_key=groq_api_key)
+    prefetcher = get_prefetcher()
+    rewrite_cache = get_rewrite_cache(draft_input, prefetcher)
+
+    # The selected combination is submitted first, then the fast draft and the
+    # other combinations as background jobs that never take its slot
+    try:
+        rewrite = prefetcher.get(
+            rewrite_cache, llm, REWRITE_MODEL, draft_prompt,
+            draft_input, option_tone, option_dialect
+        )
+    except ServiceBusyError:
+        st.warning(SERVICE_BUSY_MESSAGE)
+        st.stop()
 
-    st.write(improved_redaction.content)
\ No newline at end of file
+    draft = None
+    if fast_draft and not rewrite.done.is_set():
+        fast_llm = load_LLM(api_key=groq_api_key, model_id=FAST_DRAFT_MODEL)
+        draft = prefetcher.get(
+            rewrite_cache, fast_llm, FAST_DRAFT_MODEL, draft_prompt,
+            draft_input, option_tone, option_dialect, speculative=True
+        )
+    if precompute:
+        prefetcher.prefetch_all(rewrite_cache, llm, REWRITE_MODEL, draft_prompt, draft_input)
+
+    # Display the rewrite as it streams in, or the fast draft until it starts
+    placeholder = st.empty()
+    with st.spinner("Generating..."):
+        while not rewrite.done.is_set():
+            if rewrite.text:
+                placeholder.write(rewrite.text)
+            elif draft is not None and draft.text:
+                with placeholder.container():
+                    st.caption(f"Fast draft from {FAST_DRAFT_MODEL}, refining...")
+                    st.write(draft.text)
+            time.sleep(REFRESH_INTERVAL)
+
+    if rewrite.error is not None:
+        placeholder.error(f"An error occurred: {rewrite.error}")
+    else:
+        placeholder.write(rewrite.text)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import threading
+from collections import deque
+
+from llm_core.executor import ServiceBusyError, current_session_id, get_service, job_cancelled
+
+# Tone and dialect options offered by the app
+TONES = ('Formal', 'Informal')
+DIALECTS = ('American', 'British')
+
+# Error message of a rewrite stopped before it was complete
+CANCELLED_MESSAGE = "The rewrite was cancelled."
+
+
+class RewriteCancelledError(RuntimeError):
+    """Error of a rewrite cancelled before it was complete."""
+
+
+class Rewrite:
+    """
+    A rewrite streamed by a background worker.
+
+    The Streamlit script thread reads `text` while the worker appends to it, so
+    partial output can be displayed before the generation has finished.
+    `done` is set once the rewrite is complete, has failed or was cancelled,
+    with `error` set in the last two cases.
+    """
+
+    def __init__(self, llm, prompt_text):
+        self.llm = llm
+        self.prompt_text = prompt_text
+        self._parts = []
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+        self.error = None
+        self.job = None
+
+    @property
+    def text(self):
+        with self._lock:
+            return "".join(self._parts)
+
+    def append(self, text):
+        with self._lock:
+            self._parts.append(text)
+
+    def finish(self, error=None):
+        """Mark the rewrite done, unless it already is (e.g. cancelled while streaming)."""
+        with self._lock:
+            if self.done.is_set():
+                return
+            self.error = error
+            self.done.set()
+
+    def cancel(self):
+        """Stop the rewrite, whether it is waiting, queued or streaming."""
+        self.finish(RewriteCancelledError(CANCELLED_MESSAGE))
+        if self.job is not None:
+            self.job.cancel()
+
+
+class RewriteCache(dict):
+    """
+    Rewrites of one draft keyed by (model_id, tone, dialect), with the ones
+    waiting for a slot of the pool.
+
+    Waiting rewrites are started by the rewrite jobs of the session as they
+    finish, in the order they were added.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._waiting = deque()
+        self._lock = threading.Lock()
+
+    def wait_for_slot(self, rewrite):
+        with self._lock:
+            self._waiting.append(rewrite)
+
+    def take(self, rewrite=None):
+        """Remove a waiting rewrite, the oldest one if None, and return it or None if not waiting."""
+        with self._lock:
+            if rewrite is None:
+                return self._waiting.popleft() if self._waiting else None
+            if rewrite in self._waiting:
+                self._waiting.remove(rewrite)
+                return rewrite
+            return None
+
+
+def stream_rewrite(rewrite):
+    """Stream the LLM output for the rewrite's prompt into it."""
+    try:
+        for chunk in rewrite.llm.stream(rewrite.prompt_text):
+            if job_cancelled() or rewrite.done.is_set():
+                # The draft has changed or the session is gone, stop reading the stream
+                rewrite.finish(RewriteCancelledError(CANCELLED_MESSAGE))
+                return
+            rewrite.append(chunk.content)
+    except Exception as e:
+        rewrite.finish(e)
+    else:
+        rewrite.finish()
+
+
+def run_rewrites(cache, rewrite):
+    """Stream rewrite, then the rewrites of cache waiting for a slot, in the same job."""
+    while rewrite is not None:
+        if job_cancelled():
+            rewrite.finish(RewriteCancelledError(CANCELLED_MESSAGE))
+            return
+        stream_rewrite(rewrite)
+        rewrite = cache.take()
+
+
+class RewritePrefetcher:
+    """
+    Run rewrites as jobs of the shared "io" pool, on behalf of the current session.
+
+    Rewrites are stored in a RewriteCache kept in st.session_state, so
+    switching back to a combination that was already generated is served
+    without a new request. Speculative rewrites are background jobs of the
+    pool (see FairPool.submit_background), so they never take the slot of the
+    rewrite the user is waiting for; the ones the pool rejects wait in the
+    cache for a slot instead of being dropped.
+    """
+
+    def get(self, cache, llm, model_id, prompt, draft, tone, dialect, speculative=False):
+        """
+        Return the cached rewrite for the combination, submitting it if needed.
+
+        Failed rewrites are resubmitted so a transient error is not cached, and
+        waiting ones are submitted again.
+
+        Returns:
+        - Rewrite: The rewrite, possibly waiting for a slot if speculative.
+
+        Raises:
+        - ServiceBusyError: If the pool rejects a rewrite that is not speculative.
+        """
+        key = (model_id, tone, dialect)
+        rewrite = cache.get(key)
+        if rewrite is None or rewrite.error is not None:
+            rewrite = Rewrite(llm, prompt.format(tone=tone, dialect=dialect, draft=draft))
+        elif rewrite.job is not None or cache.take(rewrite) is None:
+            return rewrite
+
+        service = get_service()
+        submit = service.submit_background if speculative else service.submit
+        try:
+            rewrite.job = submit("io", current_session_id(), run_rewrites, cache, rewrite)
+            # A job cancelled while queued never runs: the rewrite still has to be done
+            rewrite.job.future.add_done_callback(
+                lambda future: rewrite.finish(RewriteCancelledError(CANCELLED_MESSAGE))
+            )
+        except ServiceBusyError:
+            # Speculative rewrites, and waiting ones the user now selects, keep their place
+            if speculative or cache.get(key) is rewrite:
+                cache.wait_for_slot(rewrite)
+            if not speculative:
+                raise
+        cache[key] = rewrite
+        return rewrite
+
+    def cancel(self, cache):
+        """Cancel the rewrites of cache not done yet, e.g. when the draft has changed."""
+        while cache.take() is not None:
+            pass
+        for rewrite in cache.values():
+            rewrite.cancel()
+
+    def prefetch_all(self, cache, llm, model_id, prompt, draft):
+        """Submit the rewrites for every tone and dialect combination not cached yet."""
+        for tone in TONES:
+            for dialect in DIALECTS:
+                self.get(cache, llm, model_id, prompt, draft, tone, dialect, speculative=True)
@@ -1,61 +1,106 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
-from langchain.evaluation.qa import QAEvalChain
+from llm_core import resources
+from llm_core.config import get_settings
+from llm_core.executor import run_job
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
+from llm_core.stream_reader import iter_decoded_blocks, iter_split_text
 
 # Model options
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
+models = MODEL_OPTIONS
 
-def generate_response(uploaded_file, api_key, model_id, query_text, response_text):
-    # Format uploaded file
-    documents = [uploaded_file.read().decode()]
-    
-    # Break it into small chunks
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-    texts = text_splitter.create_documents(documents)
-    embeddings = HuggingFaceEmbeddings()
-    
-    # Create a vector store and store the texts
-    db = FAISS.from_documents(texts, embeddings)
+# Function to group streamed chunks into document batches
+def iter_document_batches(chunks, batch_size=None):
+    from langchain.docstore.document import Document
+
+    batch_size = batch_size or get_settings().embedding_batch_size
+
+    batch = []
+    for chunk in chunks:
+        batch.append(Document(page_content=chunk))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Function to embed a document into a vector store while it is read, CPU-bound
+def build_store(uploaded_file, embeddings):
+    from langchain.text_splitter import CharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
+
+    # Stream the uploaded file and break it into small chunks as it is read
+    text_splitter = CharacterTextSplitter(chunk_size=get_settings().chunk_size, chunk_overlap=0)
+    chunks = iter_split_text(iter_decoded_blocks(uploaded_file), text_splitter)
     
-    # Create a retriever interface
-    retriever = db.as_retriever()
+    # Create a vector store and embed each batch as soon as it is available
+    db = None
+    for batch in iter_document_batches(chunks):
+        if db is None:
+            db = FAISS.from_documents(batch, embeddings)
+        else:
+            db.add_documents(batch)
+    return db
+
+def generate_response(uploaded_file, api_key, model_id, query_text, response_text):
+    # Heavy dependencies are imported on first use, so the page renders first
+    from langchain.chains import RetrievalQA
+    from langchain.evaluation.qa import QAEvalChain
+    from llm_core.rerank import DEFAULT_FETCH_K, PostRetrievalRetriever
+
+    # The shared models are leased, so they are not evicted while the jobs use them
+    with resources.leases():
+        # Embed the document in the shared CPU pool
+        db = run_job("cpu", build_store, uploaded_file, resources.embeddings(), label="📄 Reading the document...")
+
+        if db is None:
+            st.error("The uploaded document is empty.")
+            return None
     
-    # Create a real QA dictionary
-    real_qa = [{"question": query_text, "answer": response_text}]
+        # Create a retriever interface that fetches extra candidates, drops duplicate
+        # chunks, reranks them and keeps the best ones
+        retriever = PostRetrievalRetriever(
+            base_retriever=db.as_retriever(search_kwargs={"k": DEFAULT_FETCH_K}),
+            reranker=resources.reranker(),
+            max_tokens=1000,
+            max_documents=4
+        )
     
-    grop_chat = ChatGroq(temperature=0, api_key=api_key, model=model_id)
+        # Create a real QA dictionary
+        real_qa = [{"question": query_text, "answer": response_text}]
     
-    # Regular QA chain
-    qachain = RetrievalQA.from_chain_type(
-        llm=grop_chat,
-        chain_type="stuff",
-        retriever=retriever,
-        input_key="question"
-    )
+        grop_chat = resources.chat_model(model_id, api_key, temperature=0)
     
-    # Predictions
-    predictions = qachain.batch(real_qa)
+        # Regular QA chain
+        qachain = RetrievalQA.from_chain_type(
+            llm=grop_chat,
+            chain_type="stuff",
+            retriever=retriever,
+            input_key="question"
+        )
     
-    # Create an eval chain
-    eval_chain = QAEvalChain.from_llm(llm=grop_chat)
+        # Predictions, then have the model grade itself, in the shared I/O pool
+        def predict_and_grade():
+            predictions = qachain.batch(real_qa)
+        
+            # Create an eval chain
+            eval_chain = QAEvalChain.from_llm(llm=grop_chat)
+        
+            graded_outputs = eval_chain.evaluate(
+                real_qa, predictions,
+                question_key="question",
+                prediction_key="result",
+                answer_key="answer"
+            )
+            return predictions, graded_outputs
     
-    # Have it grade itself
-    graded_outputs = eval_chain.evaluate(
-        real_qa, predictions,
-        question_key="question",
-        prediction_key="result",
-        answer_key="answer"
-    )
+        predictions, graded_outputs = run_job("io", predict_and_grade, label="🧠 Asking and grading...")
     
     response = {
         "predictions": predictions,
@@ -67,6 +112,17 @@ def generate_response(uploaded_file, api_key, model_id, query_text, response_tex
 st.set_page_config(page_title="Evaluate a RAG App")
 st.title("🚀 Evaluate a RAG App 🚀")
 
+# Warm up the heavy imports while the user fills in the form
+preload(
+    "langchain_huggingface.embeddings",
+    "langchain_community.vectorstores",
+    "langchain.chains",
+    "langchain.evaluation.qa",
+    "llm_core.rerank",
+    "sentence_transformers",
+    "llm_core.router"
+)
+
 with st.expander("📊 Evaluate the quality of a RAG APP 📊"):
     st.write("""
         To evaluate the quality of a RAG app, we will ask it questions for which we already know the real answers.
@@ -107,7 +163,8 @@ with st.form("myform", clear_on_submit=True):
                 query_text,
                 response_text
             )
-            result.append(response)
+            if response:
+                result.append(response)
             del groq_api_key
             
 if result:
@@ -1,6 +1,15 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+from llm_core import resources
+from llm_core.executor import run_job
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
+from llm_core.prompt_budget import PromptBudget, PromptTooLongError, get_encoding
 
 # Template for information extraction
 template = """\
@@ -28,30 +37,52 @@ Output example:
 - How was the price perceived? Cheap
 """
 
+# Shorter template used when the review leaves no room for the full instructions
+compact_template = """\
+Extract from the review below:
+- Sentiment: Positive, Negative, Neutral or Unknown
+- How long took it to deliver? Number of days, or No information about this
+- How was the price perceived? Expensive, Cheap, Neutral or Unknown
+
+Review:
+{text}
+"""
+
+# Maximum number of tokens generated for the extracted insights
+MAX_EXTRACTION_TOKENS = 256
+
 # Models dictionary
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
-
-# Definition of template variables
-prompt = PromptTemplate(
-    input_variables=["text"],
-    template=template,
-)
+models = MODEL_OPTIONS
+
+# Token budget of both templates, built on first use so LangChain is not imported before the page renders
+@st.cache_resource
+def get_prompt_budget():
+    from langchain.prompts import PromptTemplate
+
+    # Definition of template variables
+    prompt = PromptTemplate(
+        input_variables=["text"],
+        template=template,
+    )
+
+    compact_prompt = PromptTemplate(
+        input_variables=["text"],
+        template=compact_template,
+    )
+    return PromptBudget(prompt, compact_prompt, input_variable="text")
 
 # Function to load the LLM model
 def load_llm_model(groq_api_key, model_id):
-    llm = ChatGroq(temperature=0, api_key=groq_api_key, model=model_id)
+    llm = resources.chat_model(model_id, groq_api_key, temperature=0, max_tokens=MAX_EXTRACTION_TOKENS)
     return llm
 
 # Streamlit page configuration
 st.set_page_config(page_title="Product Review Wizard 🌟")
 st.title("Product Review Wizard 📊")
 
+# Warm up the Groq client and the tokenizer while the user types the review
+preload("llm_core.router", "langchain.prompts", get_encoding)
+
 # Layout columns for UI
 col1, col2 = st.columns([2, 1])
 
@@ -80,10 +111,13 @@ st.markdown("## Share Your Product Review 📝")
 
 review_input = st.text_area(label="Product Review", placeholder="Your Product Review...", key="review_input")
 
-# Validate review length
-if len(review_input.split(" ")) > 700:
-    st.write("Please keep your product review under 700 words for best results.")
-    st.stop()
+# Validate review length against the selected model context window
+if review_input:
+    try:
+        review_prompt, _ = get_prompt_budget().fit(models[selected_model], review_input, MAX_EXTRACTION_TOKENS)
+    except PromptTooLongError as e:
+        st.write(f"Please keep your product review shorter. {e}")
+        st.stop()
 
 # Output: Key data extraction
 st.markdown("### 📊 Key Insights Extracted:")
@@ -98,10 +132,10 @@ with st.spinner("Extracting key data..."):
         llm = load_llm_model(groq_api_key=groq_api_key, model_id=models[selected_model])
 
         # Format the template with the product review
-        prompt_with_review = prompt.format(text=review_input)
+        prompt_with_review = review_prompt.format(text=review_input)
 
-        # Invoke the LLM model to extract key data
-        key_data_extraction = llm.invoke(prompt_with_review)
+        # Invoke the LLM model to extract key data, in the shared I/O pool
+        key_data_extraction = run_job("io", llm.invoke, prompt_with_review, label="Extracting key data...")
 
          # Print key_data_extraction to console
         print(key_data_extraction)
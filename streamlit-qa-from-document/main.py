@@ -1,19 +1,18 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain.chains import RetrievalQA
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from PyPDF2 import PdfReader
+import pdf_pipeline
+from llm_core import resources
+from llm_core.executor import run_job
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
 
 # Model options
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
+models = MODEL_OPTIONS
 
 def generate_response(file, groq_api_key, model_id, query):
     """
@@ -21,31 +20,18 @@ def generate_response(file, groq_api_key, model_id, query):
     store embeddings in a vector store, and run the QA chain with the query.
     """
     try:
-        # Format file
-        reader = PdfReader(file)
-        formatted_document = []
-        for page in reader.pages:
-            formatted_document.append(page.extract_text())
-
-        # Split file into chunks
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        docs = text_splitter.create_documents(formatted_document)
-
-        # Create embeddings
-        embeddings = HuggingFaceEmbeddings()
-
-        # Load to vector database
-        store = FAISS.from_documents(docs, embeddings)
-
-        # Create retrieval chain
-        retrieval_chain = RetrievalQA.from_chain_type(
-            llm=ChatGroq(temperature=0, api_key=groq_api_key, model=model_id),
-            chain_type="stuff",
-            retriever=store.as_retriever()
-        )
-
-        # Run chain with query
-        response = retrieval_chain.invoke(query)
+        # The shared models are leased, so they are not evicted while the jobs use them
+        with resources.leases():
+            # Parse and embed the document in the shared CPU pool, the embedding
+            # model is loaded once and shared by all sessions and apps
+            store = run_job("cpu", pdf_pipeline.build_store, file, resources.embeddings(), label="📄 Reading the document...")
+
+            # Run the QA chain with the query in the shared I/O pool
+            llm = resources.chat_model(model_id, groq_api_key, temperature=0)
+            response = run_job(
+                "io", pdf_pipeline.answer_question, store, llm, query, resources.reranker(),
+                label="🧠 Asking the model..."
+            )
         return response
 
     except Exception as e:
@@ -55,6 +41,17 @@ def generate_response(file, groq_api_key, model_id, query):
 st.set_page_config(page_title="Q&A from a Long PDF Document")
 st.title("🔍 Ask Anything: Q&A from Your PDF! 📄")
 
+# Warm up the heavy imports while the user uploads the document
+preload(
+    "PyPDF2",
+    "langchain_huggingface.embeddings",
+    "langchain_community.vectorstores",
+    "langchain.chains",
+    "llm_core.rerank",
+    "sentence_transformers",
+    "llm_core.router"
+)
+
 # File uploader for PDF document
 uploaded_file = st.file_uploader("✨ Upload your PDF document here", type="pdf")
 
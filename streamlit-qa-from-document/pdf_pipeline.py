@@ -0,0 +1,67 @@
+# Question answering over a PDF file, without Streamlit so it can be load tested.
+# Heavy dependencies are imported where they are used, so the page renders first.
+
+
+def build_store(file, embeddings):
+    """
+    Parse a PDF file, split its text into chunks and embed them in a vector store.
+
+    Parameters:
+    - file: Binary file-like object of the PDF (e.g. a Streamlit UploadedFile).
+    - embeddings (Embeddings): Model embedding the chunks.
+
+    Returns:
+    - FAISS: The vector store of the chunks.
+    """
+    from langchain.text_splitter import CharacterTextSplitter
+    from langchain_community.vectorstores import FAISS
+    from llm_core.config import get_settings
+    from PyPDF2 import PdfReader
+
+    # Format file
+    reader = PdfReader(file)
+    formatted_document = []
+    for page in reader.pages:
+        formatted_document.append(page.extract_text())
+
+    # Split file into chunks
+    text_splitter = CharacterTextSplitter(chunk_size=get_settings().chunk_size, chunk_overlap=0)
+    docs = text_splitter.create_documents(formatted_document)
+
+    # Load to vector database
+    return FAISS.from_documents(docs, embeddings)
+
+
+def answer_question(store, llm, query, reranker=None):
+    """
+    Answer a question from the chunks of a vector store.
+
+    Parameters:
+    - store (VectorStore): Vector store built by build_store().
+    - llm: Chat model writing the answer.
+    - query (str): The question.
+    - reranker (CrossEncoderReranker): Reranker of the retrieved chunks, None to keep the vector order.
+
+    Returns:
+    - dict: The chain output, with the answer in "result".
+    """
+    from langchain.chains import RetrievalQA
+    from llm_core.rerank import DEFAULT_FETCH_K, PostRetrievalRetriever
+
+    # Fetch extra candidates, drop duplicate chunks, rerank them and keep the best ones
+    retriever = PostRetrievalRetriever(
+        base_retriever=store.as_retriever(search_kwargs={"k": DEFAULT_FETCH_K}),
+        reranker=reranker,
+        max_tokens=1000,
+        max_documents=4
+    )
+
+    # Create retrieval chain
+    retrieval_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever
+    )
+
+    # Run chain with query
+    return retrieval_chain.invoke(query)
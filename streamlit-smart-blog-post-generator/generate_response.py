@@ -1,14 +1,216 @@
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-import streamlit as st
+import math
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from llm_core import resources
+from llm_core.executor import map_jobs
+from llm_core.prompt_budget import PromptBudget
 
-def generate_blog_post(topic, num_characters, language, tone, groq_api_key, temperature, model_id):
+# Template for the blog post, defined once instead of being rebuilt on every call
+template = """
+As an experienced startup and venture capital writer,
+generate a {num_words}-word blog post about {topic} in {language}.
+
+Print only the blog post and write {end_marker} on its own line when it is finished.
+Remember, everything that you generate needs to be in {language} and in a {tone} tone.
+"""
+
+# Marker the model writes after the blog post, used as a stop sequence
+END_MARKER = "<END_OF_POST>"
+
+# Tokens generated per word by the Groq models for each language, used until
+# enough blog posts have been generated to calibrate the ratio
+DEFAULT_TOKENS_PER_WORD = {
+    "English": 1.35,
+    "Spanish": 1.6,
+    "French": 1.65,
+    "German": 1.75,
+    "Italian": 1.65,
+}
+
+# Extra room given to the model above the requested length before it is cut off
+LENGTH_SLACK = 0.15
+
+@lru_cache(maxsize=None)
+def get_prompt_budget():
+    """Token budget of the template, built on first use so LangChain is not imported before the page renders."""
+    from langchain.prompts import PromptTemplate
+
+    # Creating a PromptTemplate instance with input variables and the template
+    prompt = PromptTemplate(
+        input_variables=["topic", "num_words", "language", "tone"],
+        partial_variables={"end_marker": END_MARKER},
+        template=template
+    )
+    return PromptBudget(prompt, input_variable="topic")
+
+
+@dataclass
+class BlogPostJob:
+    """Parameters of one blog post to generate."""
+    topic: str
+    num_words: int
+    language: str
+    tone: str
+
+
+@dataclass
+class BlogPostResult:
+    """A generated blog post and the measurements taken while generating it."""
+    job: BlogPostJob
+    text: str = ""
+    word_count: int = 0
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    truncated: bool = False
+    error: str = None
+
+    @property
+    def overshoot(self):
+        """Relative difference between the generated and the requested number of words."""
+        return (self.word_count - self.job.num_words) / self.job.num_words
+
+
+class LengthCalibration:
+    """
+    Tokens-per-word ratio of each model and language, calibrated from generated posts.
+
+    The ratio starts from DEFAULT_TOKENS_PER_WORD and follows an exponential
+    moving average of the ratios observed in the generated posts. Truncated
+    posts are observations too: the words they contain were produced with
+    the tokens they used, and leaving them out would only let the ratio, and
+    therefore the budget, go down.
+
+    Parameters:
+    - smoothing (float): Weight given to each new observation.
+    """
+
+    def __init__(self, smoothing=0.2):
+        self._ratios = {}
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def tokens_per_word(self, model_id, language):
+        default = DEFAULT_TOKENS_PER_WORD.get(language, max(DEFAULT_TOKENS_PER_WORD.values()))
+        with self._lock:
+            return self._ratios.get((model_id, language), default)
+
+    def max_tokens(self, model_id, num_words, language):
+        """Token budget for a post of num_words words in language, written by model_id."""
+        return math.ceil(num_words * self.tokens_per_word(model_id, language) * (1 + LENGTH_SLACK))
+
+    def update(self, model_id, result):
+        if not result.word_count or not result.output_tokens:
+            return
+        observed = result.output_tokens / result.word_count
+        key = (model_id, result.job.language)
+        with self._lock:
+            ratio = self._ratios.get(key, observed)
+            self._ratios[key] = ratio + self._smoothing * (observed - ratio)
+
+
+# Calibration shared by every generation in this process
+length_calibration = LengthCalibration()
+
+
+class RateLimiter:
+    """
+    Space out requests to stay under a per-minute limit.
+
+    Parameters:
+    - requests_per_minute (int): Maximum number of requests started per minute.
+    """
+
+    def __init__(self, requests_per_minute):
+        self._interval = 60.0 / requests_per_minute
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Seconds to wait before the next request may start, or 0 after taking the slot to start it now."""
+        with self._lock:
+            now = time.monotonic()
+            if self._next_slot > now:
+                return self._next_slot - now
+            self._next_slot = now + self._interval
+            return 0
+
+
+def load_llm(groq_api_key, temperature, model_id):
+    """
+    Initialize the chat model (or the model router) with the specified parameters.
+
+    Raises:
+    - ValueError: If the Groq API key does not start with "gsk_".
+    """
+    # Check if the Groq API key is valid
+    if not groq_api_key.startswith("gsk_"):
+        raise ValueError("Invalid Groq API Key. Please enter a valid API key starting with 'gsk_'.")
+
+    # Shared with the other posts and sessions using the same key and parameters
+    return resources.chat_model(model_id, groq_api_key, temperature=temperature)
+
+
+def write_blog_post(llm, model_id, job):
+    """
+    Generate the blog post described by job with an already initialized LLM.
+
+    The requested number of words is converted into a token budget with the
+    calibrated ratio of the language, and generation stops at END_MARKER or
+    when the budget is exhausted.
+
+    Returns:
+    - BlogPostResult: The blog post, its word count (computed locally), latency and token usage.
+
+    Raises:
+    - PromptTooLongError: If the topic and the requested length do not fit in the model context window.
+    """
+    # Converting the requested number of words into a token budget
+    max_tokens = length_calibration.max_tokens(model_id, job.num_words, job.language)
+
+    # Checking the topic and the requested length fit in the model context window
+    prompt, _ = get_prompt_budget().fit(
+        model_id, job.topic, max_tokens,
+        num_words=job.num_words, language=job.language.lower(), tone=job.tone.lower()
+    )
+
+    # Formatting the prompt with the provided values
+    query = prompt.format(
+        topic=job.topic,
+        num_words=job.num_words,
+        language=job.language.lower(),
+        tone=job.tone.lower()
+    )
+
+    # Invoking the language model to generate the response
+    start = time.perf_counter()
+    response = llm.invoke(query, max_tokens=max_tokens, stop=[END_MARKER])
+    latency = time.perf_counter() - start
+
+    text = response.content.replace(END_MARKER, "").strip()
+    token_usage = response.response_metadata.get("token_usage", {})
+    result = BlogPostResult(
+        job=job,
+        text=text,
+        word_count=len(text.split()),
+        latency=latency,
+        input_tokens=token_usage.get("prompt_tokens", 0),
+        output_tokens=token_usage.get("completion_tokens", 0),
+        truncated=response.response_metadata.get("finish_reason") == "length",
+    )
+    length_calibration.update(model_id, result)
+    return result
+
+
+def generate_blog_post(topic, num_words, language, tone, groq_api_key, temperature, model_id):
     """
     Generate a blog post using a specified language model and parameters.
 
     Parameters:
     - topic (str): The topic for the blog post.
-    - num_characters (int): Number of characters to generate for the blog post.
+    - num_words (int): Number of words to generate for the blog post.
     - language (str): Language in which the blog post should be generated (e.g., "English", "Spanish").
     - tone (str): Tone or style of writing for the blog post (e.g., "Formal", "Informal", "Humorous").
     - groq_api_key (str): API key for accessing the Groq API.
@@ -16,40 +218,52 @@ def generate_blog_post(topic, num_characters, language, tone, groq_api_key, temp
     - model_id (str): ID of the language model to use (e.g., "llama3-70b-8192").
 
     Returns:
-    - None: Displays the generated blog post content using Streamlit.
+    - BlogPostResult: The generated blog post with its word count, latency and token usage.
 
     Raises:
     - ValueError: If the Groq API key does not start with "gsk_".
+    - PromptTooLongError: If the topic and the requested length do not fit in the model context window.
     """
-    # Check if the Groq API key is valid
-    if not groq_api_key.startswith("gsk_"):
-        raise ValueError("Invalid Groq API Key. Please enter a valid API key starting with 'gsk_'.")
-
-    # Initialize ChatGroq instance with specified parameters
-    llm = ChatGroq(model=model_id, api_key=groq_api_key, temperature=temperature)
+    llm = load_llm(groq_api_key, temperature, model_id)
+    job = BlogPostJob(topic=topic, num_words=num_words, language=language, tone=tone)
+    return write_blog_post(llm, model_id, job)
 
-    # Constructing the prompt template based on user inputs
-    template = f"""
-    As an experienced startup and venture capital writer, 
-    generate a {num_characters}-word blog post about {topic} in {language.lower()}.
 
-    Your response should be in this format:
-    First, print the blog post.
-    Then, you must add the sum the total number of words in it and print the result like this: 'This post has X words.'
-    Remember, everything that you generate needs to be in {language.lower()} and in a {tone.lower()} tone.
+def generate_blog_posts(jobs, groq_api_key, temperature, model_id, max_workers=4, requests_per_minute=30):
     """
+    Generate several blog posts concurrently.
 
-    # Creating a PromptTemplate instance with input variables and the template
-    prompt = PromptTemplate(
-        input_variables=["topic", "num_characters", "language", "tone"],
-        template=template
-    )
+    Each post is a background job of the shared "io" pool, with at most
+    max_workers (and never more than the session's background share of the
+    pool, see LLM_CORE_MAX_BACKGROUND_PER_SESSION) in flight. Posts are
+    submitted at most requests_per_minute per minute, so a post waiting for
+    the rate limit does not hold a worker. A failing job does not stop the
+    batch, its error is reported in the result instead.
 
-    # Formatting the prompt with the provided values
-    query = prompt.format(topic=topic, num_characters=num_characters, language=language, tone=tone)
+    Parameters:
+    - jobs (list of BlogPostJob): The blog posts to generate.
+    - groq_api_key (str): API key for accessing the Groq API.
+    - temperature (float): Temperature parameter for controlling the randomness of generation.
+    - model_id (str): ID of the language model to use.
+    - max_workers (int): Maximum number of requests in flight.
+    - requests_per_minute (int): Maximum number of requests started per minute.
 
-    # Invoking the language model to generate the response
-    response = llm.invoke(query, max_tokens=num_characters)
+    Yields:
+    - BlogPostResult: One result per job, in order of completion.
+
+    Raises:
+    - ValueError: If the Groq API key does not start with "gsk_".
+    - ServiceBusyError: If the "io" pool cannot accept any of the posts.
+    """
+    llm = load_llm(groq_api_key, temperature, model_id)
+    rate_limiter = RateLimiter(requests_per_minute)
+
+    def run(job):
+        try:
+            return write_blog_post(llm, model_id, job)
+        except Exception as e:
+            return BlogPostResult(job=job, error=str(e))
 
-    # Displaying the generated content using Streamlit
-    st.write(response.content)
\ No newline at end of file
+    # Pending posts are cancelled if the caller stops iterating
+    for _, future in map_jobs("io", run, jobs, limit=max_workers, background=True, throttle=rate_limiter.delay):
+        yield future.result()
@@ -1,5 +1,18 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import json
+from dataclasses import asdict
 import streamlit as st
-from generate_response import generate_blog_post
+from llm_core.config import get_settings
+from llm_core.executor import SERVICE_BUSY_MESSAGE, ServiceBusyError, run_job
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
+from generate_response import BlogPostJob, generate_blog_post, generate_blog_posts, get_prompt_budget
+from llm_core.prompt_budget import PromptTooLongError, get_encoding
 
 # Page configuration
 st.set_page_config(
@@ -9,6 +22,9 @@ st.set_page_config(
 # App title
 st.title("Smart Blog Post Generator")
 
+# Warm up the Groq client and the tokenizer while the user fills in the form
+preload("llm_core.router", get_encoding, get_prompt_budget)
+
 # Sidebar input for Groq API key
 groq_api_key = st.sidebar.text_input(
     "Groq API Key",  # Label for the text input
@@ -21,14 +37,22 @@ temperature = st.sidebar.number_input(
     format="%.2f"  # Number format with two decimal places
 )
 
+# Sidebar inputs for batch generation, up to the session's background share of the shared I/O pool
+max_concurrent = get_settings().max_background_per_session
+max_workers = st.sidebar.number_input(
+    "Concurrent Requests (batch)",  # Label for the number input
+    min_value=1,
+    max_value=max_concurrent,
+    value=max_concurrent
+)
+requests_per_minute = st.sidebar.number_input(
+    "Requests per Minute (batch)",  # Label for the number input
+    min_value=1,
+    value=30
+)
+
 # Dictionary of available model options
-model_options = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
+model_options = MODEL_OPTIONS
 
 # Sidebar dropdown menu to select a model
 model_choice = st.sidebar.selectbox(
@@ -39,16 +63,88 @@ model_choice = st.sidebar.selectbox(
 # Get the ID of the selected model
 selected_model_id = model_options[model_choice]
 
-# Main input fields for generating the blog post
-topic_text = st.text_input("Enter Topic:")  # Input for the topic
-num_characters = st.number_input("Number of Characters:", min_value=100, step=50)  # Input for the number of characters
-language = st.selectbox("Language:", ["English", "Spanish", "French", "German", "Italian"])  # Dropdown for selecting language
-tone = st.selectbox("Tone:", ["Formal", "Informal", "Humorous", "Serious", "Optimistic"])  # Dropdown for selecting tone
+# Options for the blog post language and tone
+languages = ["English", "Spanish", "French", "German", "Italian"]
+tones = ["Formal", "Informal", "Humorous", "Serious", "Optimistic"]
+
+# Function to display a generated blog post with its measurements
+def show_result(result):
+    if result.error:
+        st.error(f"{result.job.topic}: {result.error}")
+        return
+    st.write(result.text)
+    st.caption(
+        f"{result.word_count} words (requested {result.job.num_words}, {result.overshoot:+.0%}) · "
+        f"{result.latency:.1f}s · {result.input_tokens} input tokens · {result.output_tokens} output tokens"
+    )
+    if result.truncated:
+        st.warning("The blog post was cut off at the token budget for the requested length.")
+
+# Generation mode: a single blog post or a batch of jobs
+mode = st.radio("Mode:", ["Single post", "Batch"], horizontal=True)
+
+if mode == "Single post":
+    # Main input fields for generating the blog post
+    topic_text = st.text_input("Enter Topic:")  # Input for the topic
+    num_words = st.number_input("Number of Words:", min_value=100, step=50)  # Input for the number of words
+    language = st.selectbox("Language:", languages)  # Dropdown for selecting language
+    tone = st.selectbox("Tone:", tones)  # Dropdown for selecting tone
+else:
+    # Imported here, pandas alone takes a third of a second to import
+    import pandas as pd
+
+    # Editable table with one row per blog post to generate
+    jobs_table = st.data_editor(
+        pd.DataFrame([{"topic": "", "num_words": 500, "language": languages[0], "tone": tones[0]}]),
+        num_rows="dynamic",
+        column_config={
+            "topic": st.column_config.TextColumn("Topic", required=True),
+            "num_words": st.column_config.NumberColumn("Length", min_value=100, step=50, required=True),
+            "language": st.column_config.SelectboxColumn("Language", options=languages, required=True),
+            "tone": st.column_config.SelectboxColumn("Tone", options=tones, required=True),
+        }
+    )
 
 # Check if the Groq API key is valid
 if not groq_api_key.startswith("gsk_"):
     st.warning("Enter a valid Groq Key")
-else:
+elif mode == "Single post":
     if st.button("Generate"):
-        with st.spinner("Generating blog post..."):  # Show a spinner while generating
-            generate_blog_post(topic_text, num_characters, language, tone, groq_api_key, temperature, selected_model_id)
\ No newline at end of file
+        try:
+            # Generate in the shared I/O pool, with a spinner while generating
+            result = run_job(
+                "io", generate_blog_post,
+                topic_text, num_words, language, tone, groq_api_key, temperature, selected_model_id,
+                label="Generating blog post..."
+            )
+            show_result(result)
+        except PromptTooLongError as e:
+            st.warning(f"Please request a shorter blog post. {e}")
+else:
+    jobs = [
+        BlogPostJob(topic=row.topic, num_words=int(row.num_words), language=row.language, tone=row.tone)
+        for row in jobs_table.dropna().itertuples()
+        if row.topic.strip()
+    ]
+    if st.button(f"Generate {len(jobs)} blog posts", disabled=not jobs):
+        progress = st.progress(0.0, text="Generating blog posts...")
+
+        # Display each blog post as soon as it is completed, each post is a job of the shared I/O pool
+        results = []
+        try:
+            with st.spinner("Generating blog posts..."):
+                for result in generate_blog_posts(jobs, groq_api_key, temperature, selected_model_id, max_workers, requests_per_minute):
+                    results.append(result)
+                    progress.progress(len(results) / len(jobs), text=f"{len(results)}/{len(jobs)} blog posts generated")
+                    with st.expander(f"{result.job.topic} ({result.job.language}, {result.job.tone})", expanded=False):
+                        show_result(result)
+        except ServiceBusyError:
+            st.warning(SERVICE_BUSY_MESSAGE)
+            st.stop()
+
+        st.download_button(
+            "Download results (JSON)",
+            data=json.dumps([asdict(result) for result in results], ensure_ascii=False, indent=2),
+            file_name="blog_posts.json",
+            mime="application/json"
+        )
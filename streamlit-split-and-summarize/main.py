@@ -1,27 +1,31 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain.chains.summarize import load_summarize_chain
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from llm_core import resources
+from llm_core.executor import SERVICE_BUSY_MESSAGE, ServiceBusyError
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
+from summary_pipeline import DocumentTooLongError, split_document, summarize_chunks
 
 # Function to load LLM model
 def load_llm_model(model_id, groq_api_key):
-    # Ensure your Groq API key is set as an environment variable
-    llm = ChatGroq(model=model_id, temperature=0, api_key=groq_api_key)
+    llm = resources.chat_model(model_id, groq_api_key, temperature=0)
     return llm
 
-# Function to split text into chunks
-def split_text(text):
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["\n\n", "\n"], 
-        chunk_size=5000, 
-        chunk_overlap=350
-    )
-    return text_splitter.create_documents([text])
-
 # Streamlit page configuration
 st.set_page_config(page_title="AI Long Text Summarizer", layout="wide")
 st.title("AI Long Text Summarizer")
 
+# Warm up the heavy imports while the user uploads the file
+preload(
+    "langchain.text_splitter",
+    "llm_core.router"
+)
+
 # Introduction and credits
 st.markdown("""
     ### Summarize long texts with AI technology powered by Groq.
@@ -33,13 +37,7 @@ st.markdown("""
 groq_api_key = st.text_input("Enter Your Groq API Key", type="password")
 
 # Model selector
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
+models = MODEL_OPTIONS
 selected_model = st.selectbox("Select LLM Model", list(models.keys()))
 
 # Upload file for text to summarize
@@ -49,27 +47,43 @@ uploaded_file = st.file_uploader("Upload a text file (.txt)", type="txt")
 st.header("Summarized Text")
 
 if groq_api_key and uploaded_file:
-    # Read uploaded file
-    file_contents = uploaded_file.getvalue().decode("utf-8")
-
-    # Check text length
-    if len(file_contents.split(" ")) > 20000:
+    # Stream the uploaded file into manageable chunks, stopping as soon as the limit is exceeded
+    try:
+        document_chunks = split_document(uploaded_file)
+    except DocumentTooLongError:
         st.warning("Please upload a shorter file. Maximum length is 20,000 words.")
         st.stop()
 
-    # Split text into manageable chunks
-    document_chunks = split_text(file_contents)
-
     # Load LLM model based on selected model
     model_id = models[selected_model]
     llm_model = load_llm_model(model_id=model_id, groq_api_key=groq_api_key)
 
-    # Load and invoke summarization chain
-    summarize_chain = load_summarize_chain(llm=llm_model, chain_type="map_reduce")
-    summary_output = summarize_chain.invoke(document_chunks)
+    # Summarize the chunks, reusing the chunk summaries saved by previous runs
+    progress_bar = st.progress(0.0, text="Summarizing chunks...")
+    try:
+        # Each chunk summary is a job of the shared I/O pool
+        summary_output = summarize_chunks(
+            llm_model,
+            model_id,
+            document_chunks,
+            on_progress=lambda done, total: progress_bar.progress(
+                done / total, text=f"Summarized {done} of {total} chunks"
+            )
+        )
+    except ServiceBusyError:
+        st.warning(SERVICE_BUSY_MESSAGE)
+        st.stop()
+    except Exception as e:
+        st.error(f"Summarization stopped: {e}. The finished chunks are saved, run it again to resume.")
+        st.stop()
+    progress_bar.empty()
 
     # Display summarized text
-    st.text_area(label="Summarized Text", value=summary_output["output_text"], height=400)
+    st.text_area(label="Summarized Text", value=summary_output.text, height=400)
+    st.caption(
+        f"{summary_output.chunks} chunks, {summary_output.reused} summaries reused "
+        f"and {summary_output.generated} generated."
+    )
 
 elif groq_api_key:
     st.info("Please upload a text file to begin summarization.")
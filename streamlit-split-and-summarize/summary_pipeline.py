@@ -0,0 +1,59 @@
+# Summarization of an uploaded text file, without Streamlit so it can be load tested.
+from llm_core.summarize import content_defined_chunks, iter_paragraphs
+from llm_core.stream_reader import WordCounter, WordLimitError, iter_decoded_blocks
+
+# Maximum number of words accepted for summarization
+MAX_WORDS = 20000
+
+
+class DocumentTooLongError(ValueError):
+    """Raised when a file has more than the accepted number of words."""
+
+
+# Function to split an uploaded file into chunks while it is being read
+def split_uploaded_file(uploaded_file, word_counter):
+    # Chunks end at paragraphs chosen by their content, so an edit only changes its own chunk
+    blocks = word_counter.track(iter_decoded_blocks(uploaded_file))
+    yield from content_defined_chunks(iter_paragraphs(blocks), chunk_size=5000)
+
+
+def split_document(uploaded_file, max_words=MAX_WORDS):
+    """
+    Stream an uploaded file into manageable chunks, counting words on the fly.
+
+    Parameters:
+    - uploaded_file: Binary file-like object of the text file.
+    - max_words (int): Maximum number of words accepted.
+
+    Returns:
+    - list of str: The chunks of the file.
+
+    Raises:
+    - DocumentTooLongError: As soon as the file exceeds max_words, while it is read.
+    """
+    # The counter stops the stream at the first block going over the limit
+    word_counter = WordCounter(max_words=max_words)
+    try:
+        return list(split_uploaded_file(uploaded_file, word_counter))
+    except WordLimitError:
+        raise DocumentTooLongError(f"The file has more than {max_words} words.") from None
+
+
+def summarize_chunks(llm, model_id, document_chunks, on_progress=None, cache=None):
+    """
+    Summarize the chunks, reusing the chunk summaries saved by previous runs.
+
+    Parameters:
+    - llm: Chat model writing the summaries.
+    - model_id (str): ID the model was loaded with, part of the cache key.
+    - document_chunks (list of str): Chunks from split_document().
+    - on_progress (callable): Called with (done, total) during the map step.
+    - cache (SummaryCache): Store of the summaries, the shared default one if None.
+
+    Returns:
+    - SummaryResult: The summary and how many summaries were reused or generated.
+    """
+    from llm_core.summarize import ResumableSummarizer
+
+    summarizer = ResumableSummarizer(llm, model_id, cache=cache)
+    return summarizer.summarize(document_chunks, on_progress=on_progress)
@@ -1,8 +1,14 @@
+import sys
+from pathlib import Path
+
+# Make the shared llm_core package importable when the app is run with streamlit run
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain.docstore.document import Document
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.chains.summarize import load_summarize_chain
+from llm_core import resources
+from llm_core.executor import SERVICE_BUSY_MESSAGE, ServiceBusyError
+from llm_core.models import MODEL_OPTIONS
+from llm_core.preload import preload
 
 # Function to generate response using LLM
 def generate_response(txt, groq_api_key, model_id):
@@ -15,28 +21,28 @@ def generate_response(txt, groq_api_key, model_id):
     - model_id (str): The identifier of the LLM model to use for summarization.
 
     Returns:
-    - str: The summarized text generated by the LLM model.
+    - SummaryResult: The summarized text generated by the LLM model, and how many
+      chunk summaries were reused from previous runs.
     """
-    # Initialize ChatGroq with the specified LLM model, API key, and temperature
-    llm = ChatGroq(
-        model=model_id,
-        temperature=0,  # Temperature parameter for text generation (0 means deterministic)
-        api_key=groq_api_key
+    # Heavy dependencies are imported on first use, so the page renders first
+    from llm_core.summarize import ResumableSummarizer, content_defined_chunks, iter_paragraphs
+
+    # Initialize the chat model (or the model router) with the specified LLM model, API key, and temperature
+    llm = resources.chat_model(
+        model_id,
+        groq_api_key,
+        temperature=0  # Temperature parameter for text generation (0 means deterministic)
     )
     
-    # Initialize CharacterTextSplitter to split input text into manageable chunks
-    text_splitter = CharacterTextSplitter()
-    texts = text_splitter.split_text(txt)  # Split input text into segments
-    docs = [Document(page_content=t) for t in texts]  # Create Document objects for each segment
+    # Split input text into chunks at content-defined paragraph boundaries,
+    # so editing one paragraph only changes the chunk that contains it
+    texts = list(content_defined_chunks(iter_paragraphs([txt]), chunk_size=4000))
     
-    # Load and configure the summarization chain using the LLM model
-    chain = load_summarize_chain(llm, chain_type="map_reduce")
-    
-    # Invoke the summarization chain to generate the summary
-    summary_output = chain.invoke(docs)
+    # Summarize the chunks, reusing the chunk summaries saved by previous runs
+    summarizer = ResumableSummarizer(llm, model_id)
     
     # Return the summarized text
-    return summary_output["output_text"]
+    return summarizer.summarize(texts)
 
 # Streamlit page configuration
 st.set_page_config(
@@ -46,6 +52,11 @@ st.set_page_config(
 )
 st.title("Text Summarizer Extraordinaire")
 
+# Warm up the heavy imports while the user types the text
+preload(
+    "llm_core.router"
+)
+
 # Introduction and instructions
 st.markdown("""
     ## 📝 Welcome to the Text Summarizer Extraordinaire! 🚀
@@ -72,13 +83,7 @@ txt_input = st.text_area(
 )
 
 # Model selector
-models = {
-    "LLaMA3 8b": "llama3-8b-8192",
-    "LLaMA3 70b": "llama3-70b-8192",
-    "Mixtral 8x7b": "mixtral-8x7b-32768",
-    "Gemma 7b": "gemma-7b-it",
-    "Gemma2 9b": "gemma2-9b-it"
-}
+models = MODEL_OPTIONS
 selected_model = st.selectbox("Select LLM Model", list(models.keys()))
 
 # Groq API Key input
@@ -90,10 +95,18 @@ groq_api_key = st.text_input(
 # Submit button and form handling
 if st.button("Summarize") and groq_api_key.startswith("gsk_") and txt_input:
     # Display spinner while processing
-    with st.spinner("Summarizing..."):
-        model_id = models[selected_model]
-        response = generate_response(txt_input, groq_api_key, model_id)
-        st.info(response)
+    model_id = models[selected_model]
+    try:
+        # Each chunk summary is a job of the shared I/O pool
+        with st.spinner("Summarizing..."):
+            response = generate_response(txt_input, groq_api_key, model_id)
+    except ServiceBusyError:
+        st.warning(SERVICE_BUSY_MESSAGE)
+    except Exception as e:
+        st.error(f"Summarization stopped: {e}. The finished chunks are saved, run it again to resume.")
+    else:
+        st.info(response.text)
+        st.caption(f"{response.reused} summaries reused and {response.generated} generated.")
 
 # Footer and acknowledgements
 st.markdown("---")